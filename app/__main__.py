@@ -0,0 +1,11 @@
+import uvicorn
+
+from app.settings import WS_HOST, WS_PER_MESSAGE_DEFLATE, WS_PORT
+
+if __name__ == '__main__':
+    uvicorn.run(
+        'app.http.app:app',
+        host=WS_HOST,
+        port=WS_PORT,
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
+    )
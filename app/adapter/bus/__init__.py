@@ -0,0 +1,17 @@
+from app.adapter.bus.base import FanoutBus
+from app.adapter.bus.local import LocalFanoutBus
+from app.adapter.bus.postgres import PostgresFanoutBus
+from app.settings import WS_DATA_BASE_DSN, WS_FANOUT_BACKEND, WS_FANOUT_CHANNEL
+
+
+def _create_bus() -> 'FanoutBus':
+    if WS_FANOUT_BACKEND == 'postgres':
+        return PostgresFanoutBus(WS_DATA_BASE_DSN, WS_FANOUT_CHANNEL)
+    return LocalFanoutBus()
+
+
+_bus: 'FanoutBus' = _create_bus()
+
+
+def get_fanout_bus() -> 'FanoutBus':
+    return _bus
@@ -0,0 +1,55 @@
+from typing import TYPE_CHECKING
+
+from app.logger import get_logger
+
+if TYPE_CHECKING:
+    from typing import Awaitable, Callable, Iterable
+    from uuid import UUID
+
+    Deliver = Callable[[Iterable[UUID], str, str], Awaitable[None]]
+    Invalidate = Callable[[UUID], None]
+
+
+class FanoutBus:
+    """
+    Доставляет события до сокетов пользователей во всех воркерах.
+
+    `publish` вызывается в воркере, который обработал событие, а `deliver`,
+    переданный в `start`, отправляет уже сериализованный payload в сокеты
+    получателей, открытые в текущем воркере. `meta` - короткая однострочная сводка события
+    для самого воркера: она доходит до `deliver` один раз на публикацию, в остальных
+    частях рассылки вместо неё пустая строка. `invalidate_chat` так же доходит
+    до `invalidate` каждого воркера, чтобы он забыл закэшированный состав чата.
+    """
+
+    _logger = get_logger('FanoutBus')
+
+    _deliver: 'Deliver|None' = None
+    _invalidate: 'Invalidate|None' = None
+
+    async def start(self, deliver: 'Deliver', invalidate: 'Invalidate|None' = None) -> None:
+        self._deliver = deliver
+        self._invalidate = invalidate
+
+    async def stop(self) -> None:
+        self._deliver = None
+        self._invalidate = None
+
+    async def publish(self, user_ids: 'Iterable[UUID]', payload: 'str', meta: 'str' = '') -> None:
+        raise NotImplementedError
+
+    async def invalidate_chat(self, chat_id: 'UUID') -> None:
+        raise NotImplementedError
+
+    def _invalidate_local(self, chat_id: 'UUID') -> None:
+        if self._invalidate is not None:
+            self._invalidate(chat_id)
+
+    async def _deliver_local(self, user_ids: 'Iterable[UUID]', payload: 'str', meta: 'str') -> None:
+        if self._deliver is None:
+            self._logger.warning('Bus is not started, drop payload for %s', user_ids)
+            return
+        try:
+            await self._deliver(user_ids, payload, meta)
+        except Exception as exc:  # noqa: B902, WPS440
+            self._logger.warning('Delivery failed: %r', exc)
@@ -0,0 +1,17 @@
+from typing import TYPE_CHECKING
+
+from app.adapter.bus.base import FanoutBus
+
+if TYPE_CHECKING:
+    from typing import Iterable
+    from uuid import UUID
+
+
+class LocalFanoutBus(FanoutBus):
+    """Доставка только внутри текущего процесса, для запуска с одним воркером."""
+
+    async def publish(self, user_ids: 'Iterable[UUID]', payload: 'str', meta: 'str' = '') -> None:
+        await self._deliver_local(user_ids, payload, meta)
+
+    async def invalidate_chat(self, chat_id: 'UUID') -> None:
+        self._invalidate_local(chat_id)
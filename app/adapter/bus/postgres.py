@@ -0,0 +1,171 @@
+import asyncio
+from contextlib import AsyncExitStack
+from functools import partial
+from itertools import chain, repeat
+from typing import TYPE_CHECKING
+from uuid import UUID
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from app.adapter.bus.base import FanoutBus
+
+if TYPE_CHECKING:
+    from logging import Logger
+    from typing import Iterable, List
+
+    from app.adapter.bus.base import Deliver, Invalidate
+
+# Postgres ограничивает payload у NOTIFY 8000 байтами
+NOTIFY_PAYLOAD_LIMIT = 7999
+
+# событие длиннее уходит через fanout_payloads, чтобы на получателей в уведомлении оставалось место
+INLINE_PAYLOAD_LIMIT = NOTIFY_PAYLOAD_LIMIT // 2
+
+# в уведомлении вместо события - id строки fanout_payloads после этого знака
+STORED_MARK = '@'
+
+# сколько секунд строка fanout_payloads ждёт, пока её прочитают все воркеры
+STORED_PAYLOAD_TTL = 60
+
+STORE_PAYLOAD_SQL = """
+    WITH expired AS (
+        DELETE FROM fanout_payloads WHERE created_at < now() - make_interval(secs => $2)
+    )
+    INSERT INTO fanout_payloads (payload) VALUES ($1) RETURNING id
+"""
+
+LOAD_PAYLOAD_SQL = 'SELECT payload FROM fanout_payloads WHERE id = $1'
+
+# уведомление без получателей: сбросить кэш состава чата, дальше его id в hex
+INVALIDATE_MARK = '!'
+
+NOTIFY_SQL = 'SELECT pg_notify($1, $2)'
+
+RECONNECT_DELAY = 1
+
+UUID_HEX_LENGTH = 32
+
+
+def _chunk_recipients(user_ids: 'List[UUID]', budget: 'int') -> 'Iterable[str]':
+    per_chunk = (budget + 1) // (UUID_HEX_LENGTH + 1)
+    for start in range(0, len(user_ids), per_chunk):
+        chunk = user_ids[start:start + per_chunk]
+        yield ','.join(user_id.hex for user_id in chunk)
+
+
+def _notifications(user_ids: 'List[UUID]', payload: 'str', meta: 'str') -> 'List[str]':
+    """Уведомления одной публикации, `meta` уходит только в первом."""
+    budget = NOTIFY_PAYLOAD_LIMIT - len(f'\n{meta}\n{payload}'.encode())
+    headers = chain([meta], repeat(''))
+    chunks = zip(_chunk_recipients(user_ids, budget), headers)
+    return [f'{recipients}\n{header}\n{payload}' for recipients, header in chunks]
+
+
+def _recipients(chunk: 'str') -> 'List[UUID]':
+    return [UUID(hex=user_id) for user_id in chunk.split(',')]
+
+
+def _enqueue(inbox: 'asyncio.Queue[str]', conn: 'asyncpg.Connection', pid: 'int', channel: 'str', notification: 'str'):
+    inbox.put_nowait(notification)
+
+
+async def _inline(conn: 'asyncpg.Connection', payload: 'str') -> 'str':
+    """Событие для уведомления или ссылка на него в `fanout_payloads`, если оно слишком длинное."""
+    if len(payload.encode()) <= INLINE_PAYLOAD_LIMIT:
+        return payload
+    stored_id = await conn.fetchval(STORE_PAYLOAD_SQL, payload, STORED_PAYLOAD_TTL)
+    return f'{STORED_MARK}{stored_id}'
+
+
+async def _resolve(pool: 'asyncpg.Pool', payload: 'str', logger: 'Logger') -> 'str|None':
+    """Событие из уведомления, None - если его не удалось дочитать из `fanout_payloads`."""
+    if not payload.startswith(STORED_MARK):
+        return payload
+    stored_id = int(payload[len(STORED_MARK):])
+    try:
+        event = await pool.fetchval(LOAD_PAYLOAD_SQL, stored_id)
+    except (OSError, asyncpg.PostgresError) as exc:
+        logger.error('Failed to load fanout payload %s: %r', payload, exc)
+        return None
+    if event is None:
+        logger.error('Fanout payload %s expired before delivery', payload)
+    return event
+
+
+async def _listen_once(dsn: 'str', channel: 'str', inbox: 'asyncio.Queue[str]', logger: 'Logger') -> None:
+    terminated = asyncio.Event()
+    async with AsyncExitStack() as stack:
+        conn = await asyncpg.connect(dsn)
+        stack.push_async_callback(conn.close)
+        conn.add_termination_listener(lambda _: terminated.set())
+        # уведомления разбираются по очереди в `_dispatch`, чтобы дочитка из базы не меняла их порядок
+        await conn.add_listener(channel, partial(_enqueue, inbox))
+        logger.info('Listening fanout channel %s', channel)
+        await terminated.wait()
+
+
+class PostgresFanoutBus(FanoutBus):
+    """
+    Шина поверх LISTEN/NOTIFY той же базы, в которой лежат чаты.
+
+    Каждый воркер слушает общий канал, а событие, опубликованное в любом воркере,
+    приходит всем, включая его самого, поэтому локально `publish` ничего не доставляет.
+    Payload уведомления: id получателей в hex через запятую, `meta` (только в первом уведомлении
+    публикации) и само событие, через перевод строки.
+    Событие длиннее `INLINE_PAYLOAD_LIMIT` байт пишется в `fanout_payloads`, а в уведомлении
+    идёт `@<id>`: воркеры дочитывают его из базы и доставляют уведомления строго по очереди.
+    Сброс кэша состава чата - уведомление `!<id чата>` без получателей.
+    """
+
+    def __init__(self, dsn: 'str', channel: 'str'):
+        self._dsn = make_url(dsn).set(drivername='postgresql').render_as_string(hide_password=False)
+        self._channel = channel
+        self._pool: 'asyncpg.Pool|None' = None
+        self._listener: 'asyncio.Task|None' = None
+        self._dispatcher: 'asyncio.Task|None' = None
+        self._inbox: 'asyncio.Queue[str]' = asyncio.Queue()
+
+    async def start(self, deliver: 'Deliver', invalidate: 'Invalidate|None' = None) -> None:
+        await super().start(deliver, invalidate)
+        self._pool = await asyncpg.create_pool(self._dsn, min_size=1, max_size=4)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._listener, self._dispatcher) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._pool is not None:
+            await self._pool.close()
+        await super().stop()
+
+    async def publish(self, user_ids: 'Iterable[UUID]', payload: 'str', meta: 'str' = '') -> None:
+        user_ids = list(user_ids)
+        async with self._pool.acquire() as conn:
+            payload = await _inline(conn, payload)
+            notifications = _notifications(user_ids, payload, meta)
+            await conn.executemany(NOTIFY_SQL, [(self._channel, notification) for notification in notifications])
+
+    async def invalidate_chat(self, chat_id: 'UUID') -> None:
+        await self._pool.execute(NOTIFY_SQL, self._channel, f'{INVALIDATE_MARK}{chat_id.hex}')
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                await _listen_once(self._dsn, self._channel, self._inbox, self._logger)
+            except (OSError, asyncpg.PostgresError) as exc:
+                self._logger.error('Fanout listener failed: %r', exc)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _dispatch(self) -> None:
+        while True:
+            notification = await self._inbox.get()
+            if notification.startswith(INVALIDATE_MARK):
+                self._invalidate_local(UUID(hex=notification[len(INVALIDATE_MARK):]))
+                continue
+            recipients, meta, payload = notification.split('\n', 2)
+            event = await _resolve(self._pool, payload, self._logger)  # noqa: WPS476
+            if event is not None:
+                await self._deliver_local(_recipients(recipients), event, meta)  # noqa: WPS476
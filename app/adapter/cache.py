@@ -0,0 +1,54 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import TYPE_CHECKING, Generic, Hashable, TypeVar
+
+if TYPE_CHECKING:
+    from typing import Tuple
+
+KeyT = TypeVar('KeyT', bound=Hashable)
+ValueT = TypeVar('ValueT')
+
+
+class LRUCache(Generic[KeyT, ValueT]):
+    """LRU кэш с ограничением по размеру и опциональным TTL записей в секундах."""
+
+    def __init__(self, max_size: 'int', ttl: 'float|None' = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items: 'OrderedDict[KeyT, Tuple[float, ValueT]]' = OrderedDict()
+
+    def __len__(self) -> 'int':
+        return len(self._items)
+
+    def get(self, key: 'KeyT') -> 'ValueT|None':
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = item
+        if expires_at < monotonic():
+            self._items.pop(key)
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: 'KeyT', value: 'ValueT') -> None:
+        expires_at = float('inf')
+        if self.ttl is not None:
+            expires_at = monotonic() + self.ttl
+        self._items[key] = (expires_at, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: 'KeyT') -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
@@ -1,6 +1,7 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime
 from enum import Enum
-from typing import List
+from typing import FrozenSet, List
 from uuid import UUID
 
 from pydantic import (
@@ -28,6 +29,17 @@ class ChatDto(ChatCreateDto):
     participants: List[UserDto]
 
 
+class ChatMembershipDto(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    chat_id: UUID
+    owner_id: UUID | None
+    participant_ids: FrozenSet[UUID]
+
+    def is_member(self, user_id: UUID) -> bool:
+        return user_id == self.owner_id or user_id in self.participant_ids
+
+
 class ChatMessageCreateDto(BaseModel):
     sender_id: UUID
     chat_id: UUID
@@ -37,6 +49,7 @@ class ChatMessageCreateDto(BaseModel):
 class ChatMessageDto(ChatMessageCreateDto):
     model_config = ConfigDict(from_attributes=True)
     message_id: UUID = Field(alias='id')
+    seq: int | None = None
     readers: List[UserDto] = Field(default_factory=list)
     created_at: datetime
     updated_at: datetime
@@ -56,9 +69,75 @@ class ChatHistoryMessageDto(BaseModel):
     created_at: datetime
     updated_at: datetime
     message_id: UUID = Field(alias='id')
+    seq: int | None = None
     readers: List[UserDto] = Field(default_factory=list)
 
 
+class MessageCursor(BaseModel):
+    created_at: datetime
+    message_id: UUID
+
+    @classmethod
+    def decode(cls, cursor: str) -> 'MessageCursor':
+        created_at, message_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return cls(created_at=created_at, message_id=message_id)
+
+    def encode(self) -> str:
+        raw = '|'.join((self.created_at.isoformat(), str(self.message_id)))
+        return urlsafe_b64encode(raw.encode()).decode()
+
+
+class SearchCursor(MessageCursor):
+    rank: float
+
+    @classmethod
+    def decode(cls, cursor: str) -> 'SearchCursor':
+        raw = urlsafe_b64decode(cursor.encode()).decode()
+        rank, created_at, message_id = raw.split('|')
+        return cls(rank=rank, created_at=created_at, message_id=message_id)
+
+    def encode(self) -> str:
+        rank, created_at = repr(self.rank), self.created_at.isoformat()
+        raw = '|'.join((rank, created_at, str(self.message_id)))
+        return urlsafe_b64encode(raw.encode()).decode()
+
+
+class ChatHistoryPageDto(BaseModel):
+    messages: List[ChatHistoryMessageDto]
+    before: MessageCursor | None = None
+    after: MessageCursor | None = None
+
+
+class InboxCursor(BaseModel):
+    activity_at: datetime
+    chat_id: UUID
+
+    @classmethod
+    def decode(cls, cursor: str) -> 'InboxCursor':
+        activity_at, chat_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return cls(activity_at=activity_at, chat_id=chat_id)
+
+    def encode(self) -> str:
+        raw = '|'.join((self.activity_at.isoformat(), str(self.chat_id)))
+        return urlsafe_b64encode(raw.encode()).decode()
+
+
+class InboxChatDto(ChatDto):
+    last_message: ChatHistoryMessageDto | None = None
+    unread: int = 0
+    activity_at: datetime
+
+
+class InboxPageDto(BaseModel):
+    chats: List[InboxChatDto]
+    after: InboxCursor | None = None
+
+
+class ChatSearchPageDto(BaseModel):
+    messages: List[ChatHistoryMessageDto]
+    after: SearchCursor | None = None
+
+
 class ChatHistoryMessageResponse(BaseModel):
     model_config = ConfigDict(
         from_attributes=True,
@@ -72,6 +151,7 @@ class ChatHistoryMessageResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
     message_id: UUID = Field(alias='id')
+    seq: int | None = None
     readers: List[UserResponseDto] = Field(default_factory=list)
 
     @field_validator('user', 'readers', mode='before')
@@ -82,3 +162,29 @@ class ChatHistoryMessageResponse(BaseModel):
         if isinstance(value, list):
             return [UserResponseDto.model_validate(u.model_dump()) for u in value]  # noqa: WPS111
         return value
+
+
+class ChatHistoryPageResponse(BaseModel):
+    messages: List[ChatHistoryMessageResponse]
+    before: str | None = None
+    after: str | None = None
+
+
+class ChatSearchPageResponse(BaseModel):
+    messages: List[ChatHistoryMessageResponse]
+    after: str | None = None
+
+
+class InboxChatResponse(ChatDto):
+    last_message: ChatHistoryMessageResponse | None = None
+    unread: int = 0
+    activity_at: datetime
+
+    @field_serializer('activity_at')
+    def serialize_dates(self, dt: datetime) -> int:
+        return int(dt.timestamp())
+
+
+class InboxPageResponse(BaseModel):
+    chats: List[InboxChatResponse]
+    after: str | None = None
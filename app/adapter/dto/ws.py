@@ -1,15 +1,19 @@
 from datetime import datetime
 from enum import Enum
-from typing import List
+from typing import Annotated, Dict, List, Literal, Union
 from uuid import UUID
 
-from fastapi import WebSocket
-from pydantic import BaseModel, ConfigDict, field_serializer
+from pydantic import (
+    BaseModel, ConfigDict, Field, TypeAdapter, field_serializer,
+    field_validator,
+)
 
 from app.adapter.dto.user import UserDto
 
+RESUME_MAX_CHATS = 500
 
-class WebSocketEventType(Enum):
+
+class WebSocketEventType(str, Enum):
     MESSAGE = 'MESSAGE'
     USER_JOIN_CHAT = 'USER_JOIN_CHAT'
     USER_LEFT_CHAT = 'USER_LEFT_CHAT'
@@ -18,16 +22,17 @@ class WebSocketEventType(Enum):
     PING = 'PING'
     PONG = 'PONG'
     UPDATE_READERS = 'UPDATE_READERS'
+    RESUME = 'RESUME'
 
 
 class WebSocketEvent(BaseModel):
+    """Исходящее событие, которое рассылается участникам чата."""
+
     model_config = ConfigDict(
-        arbitrary_types_allowed=True,
         json_encoders={datetime: lambda dt: int(dt.timestamp())},
     )
 
     type: WebSocketEventType
-    ws: WebSocket
     user: UserDto
     readers: List[UserDto] = []
 
@@ -35,15 +40,58 @@ class WebSocketEvent(BaseModel):
     message_id: UUID | None = None
     user_id: UUID | None = None
     message: str | None = None
+    # номер сообщения в чате, есть только у MESSAGE
+    seq: int | None = None
+    # у RESUME от сервера: докачка обрезана, следующий номер для повторного RESUME
+    next_seq: int | None = None
     created_at: datetime | None = None
     updated_at: datetime | None = None
 
-    @property
-    def host_port(self) -> str:
-        return f'{self.ws.client.host}:{self.ws.client.port}'  # noqa: WPS237
-
     @field_serializer('created_at', 'updated_at')
     def serialize_dates(self, dt: datetime) -> int | None:
         if dt is None:
             return None
         return int(dt.timestamp())
+
+
+class PingEvent(BaseModel):
+    type: Literal[WebSocketEventType.PING, WebSocketEventType.PONG]
+
+
+class MessageEvent(BaseModel):
+    type: Literal[WebSocketEventType.MESSAGE]
+    chat_id: UUID
+    message: str
+
+    @field_validator('message')
+    @classmethod
+    def strip_nul(cls, message: str) -> str:
+        # text в Postgres не принимает \x00, а сообщение пишется одной пачкой с чужими
+        return message.replace('\x00', '')
+
+
+class UpdateReadersEvent(BaseModel):
+    type: Literal[WebSocketEventType.UPDATE_READERS]
+    chat_id: UUID
+    message_id: UUID
+
+
+class ChatPresenceEvent(BaseModel):
+    type: Literal[WebSocketEventType.USER_ENTER_CHAT, WebSocketEventType.USER_EXIT_CHAT]
+    chat_id: UUID
+
+
+class ResumeEvent(BaseModel):
+    """Докачка после переподключения: последний полученный `seq` по каждому чату."""
+
+    type: Literal[WebSocketEventType.RESUME]
+    cursors: Dict[UUID, int] = Field(max_length=RESUME_MAX_CHATS)
+
+
+# входящее событие от клиента, модель выбирается по `type`
+InboundEvent = Annotated[
+    Union[PingEvent, MessageEvent, UpdateReadersEvent, ChatPresenceEvent, ResumeEvent],
+    Field(discriminator='type'),
+]
+
+inbound_event_adapter: 'TypeAdapter[InboundEvent]' = TypeAdapter(InboundEvent)
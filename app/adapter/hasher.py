@@ -1,11 +1,19 @@
+from asyncio import get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.context import CryptContext
 
+from app.settings import WS_HASH_WORKERS
+
 pwd_context = CryptContext(schemes=['argon2'], deprecated='auto')
 
+# argon2 отпускает GIL, поэтому хэширование в потоках не блокирует event loop
+_executor = ThreadPoolExecutor(max_workers=WS_HASH_WORKERS, thread_name_prefix='hasher')
+
 
-def check_password_hash(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def check_password_hash(plain_password: str, hashed_password: str) -> bool:
+    return await get_running_loop().run_in_executor(_executor, pwd_context.verify, plain_password, hashed_password)
 
 
-def generate_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def generate_password_hash(password: str) -> str:
+    return await get_running_loop().run_in_executor(_executor, pwd_context.hash, password)
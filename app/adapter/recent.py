@@ -0,0 +1,149 @@
+from collections import OrderedDict, deque
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from app.settings import (
+    WS_HISTORY_CACHE_CHATS, WS_HISTORY_CACHE_SIZE, WS_HISTORY_CACHE_TTL,
+)
+
+if TYPE_CHECKING:
+    from datetime import datetime
+    from typing import Deque, Dict, List, Tuple
+    from uuid import UUID
+
+    from app.adapter.dto.chat import ChatHistoryMessageDto
+    from app.adapter.dto.user import UserDto
+
+
+class RecentChat:
+    """Хвост истории одного чата по возрастанию `seq` и отметки прочтения его участников."""
+
+    def __init__(self, size: 'int'):
+        self.messages: 'Deque[ChatHistoryMessageDto]' = deque(maxlen=size)
+        # последний номер сообщения чата, о котором узнал воркер
+        self.latest = 0
+        self.watermarks: 'Dict[UUID, Tuple[UserDto, datetime]]' = {}
+        self.expires_at = float('-inf')
+
+    def merge(self, messages: 'List[ChatHistoryMessageDto]') -> None:
+        if len(messages) == 1 and self._follows(messages[0]):
+            self.messages.append(messages[0])
+        else:
+            known = {msg.seq: msg for msg in self.messages}
+            known.update((msg.seq, msg) for msg in messages)
+            size = self.messages.maxlen
+            newest = sorted(known)[-size:]
+            self.messages.clear()
+            self.messages.extend(known[seq] for seq in newest)
+        if self.messages:
+            self.latest = max(self.latest, self.messages[-1].seq)
+
+    def tail(self, limit: 'int') -> 'List[ChatHistoryMessageDto]|None':
+        """Последние `limit` сообщений, если они подряд и заканчиваются самым новым, иначе None."""
+        if not self.messages or self.expires_at < monotonic():
+            return None
+        page = list(self.messages)[-limit:]
+        first, last = page[0].seq, page[-1].seq
+        contiguous = last - first == len(page) - 1
+        if last != self.latest or not contiguous:
+            return None
+        if len(page) < limit and first != 1:
+            return None
+        return page
+
+    def readers(self, created_at: 'datetime') -> 'List[UserDto]':
+        return [user for user, read_at in self.watermarks.values() if read_at >= created_at]
+
+    def advance(self, message_id: 'UUID', readers: 'List[UserDto]') -> None:
+        """Отметки всех `readers` не раньше сообщения `message_id`, если оно есть в хвосте."""
+        created_at = self._created_at(message_id)
+        if created_at is None:
+            return
+        for user in readers:
+            current = self.watermarks.get(user.user_id)
+            if current is None or current[1] < created_at:
+                self.watermarks[user.user_id] = (user, created_at)
+
+    def _created_at(self, message_id: 'UUID') -> 'datetime|None':
+        for msg in reversed(self.messages):
+            if msg.message_id == message_id:
+                return msg.created_at
+        return None
+
+    def _follows(self, msg: 'ChatHistoryMessageDto') -> 'bool':
+        if not self.messages:
+            return False
+        return self.messages[-1].seq + 1 == msg.seq
+
+
+class RecentMessages:
+    """
+    Первые страницы истории активных чатов в памяти воркера.
+
+    Хвост чата наполняется чтением из базы и сообщениями, которые отправлены через
+    этот воркер. О сообщениях из других воркеров известен только номер из шины: пока
+    хвост до него не дотянулся, страница читается из базы. Отметки прочтения двигаются
+    событиями `UPDATE_READERS`, остальные изменения (отметки от чтения истории, выход
+    из чата) видны после перечитывания из базы раз в `ttl` секунд.
+    """
+
+    def __init__(self, size: 'int', max_chats: 'int', ttl: 'float'):
+        self._size = size
+        self._max_chats = max_chats
+        self._ttl = ttl
+        self._chats: 'OrderedDict[UUID, RecentChat]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> 'int':
+        return len(self._chats)
+
+    def page(self, chat_id: 'UUID', limit: 'int') -> 'List[ChatHistoryMessageDto]|None':
+        chat = self._chats.get(chat_id)
+        messages = None if chat is None else chat.tail(limit)
+        if messages is None:
+            self.misses += 1
+            return None
+        self._chats.move_to_end(chat_id)
+        self.hits += 1
+        return [
+            msg.model_copy(update={'readers': chat.readers(msg.created_at)})
+            for msg in messages
+        ]
+
+    def put(
+            self,
+            chat_id: 'UUID',
+            messages: 'List[ChatHistoryMessageDto]',
+            watermarks: 'List[Tuple[UserDto, datetime]]|None' = None,
+    ) -> None:
+        """Сообщения по возрастанию `seq`, а если они прочитаны из базы - и отметки прочтения вместе с ними."""
+        chat = self._chat(chat_id)
+        chat.merge(messages)
+        if watermarks is not None:
+            chat.watermarks = {user.user_id: (user, read_at) for user, read_at in watermarks}
+            chat.expires_at = monotonic() + self._ttl
+
+    def seen(self, chat_id: 'UUID', seq: 'int') -> None:
+        chat = self._chat(chat_id)
+        chat.latest = max(chat.latest, seq)
+
+    def read(self, chat_id: 'UUID', message_id: 'UUID', readers: 'List[UserDto]') -> None:
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            chat.advance(message_id, readers)
+
+    def _chat(self, chat_id: 'UUID') -> 'RecentChat':
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            self._chats.move_to_end(chat_id)
+            return chat
+
+        chat = RecentChat(self._size)
+        self._chats[chat_id] = chat
+        if len(self._chats) > self._max_chats:
+            self._chats.popitem(last=False)
+        return chat
+
+
+recent_messages = RecentMessages(WS_HISTORY_CACHE_SIZE, WS_HISTORY_CACHE_CHATS, WS_HISTORY_CACHE_TTL)
@@ -0,0 +1,219 @@
+import asyncio
+import uuid
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from sqlalchemy import BigInteger, column, func, insert, select, update, values
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.exc import DBAPIError
+
+from app.adapter.dto.chat import ChatMessageDto
+from app.adapter.store.instrument import db_operation
+from app.adapter.store.models import Chat, Message
+from app.adapter.store.unread import increment_unread_stmt
+from app.logger import get_logger
+
+if TYPE_CHECKING:
+    from typing import Dict, List, Tuple, Union
+
+    from sqlalchemy import Row
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+    from app.adapter.dto.chat import ChatMessageCreateDto
+
+    PendingMessage = Tuple[ChatMessageCreateDto, asyncio.Future]
+    Outcome = Union[ChatMessageDto, Exception]
+
+
+def _bump_seqs_stmt(counts: 'Counter'):
+    bumps = values(
+        column('chat_id', UUID(as_uuid=True)),
+        column('added', BigInteger),
+        name='bumps',
+    ).data(sorted(counts.items()))
+    return (
+        update(Chat)
+        .where(Chat.id == bumps.c.chat_id)
+        .values(last_seq=Chat.last_seq + bumps.c.added)
+        .returning(Chat.id, Chat.last_seq)
+    )
+
+
+def _lock_chats_stmt(chat_ids: 'List[uuid.UUID]'):
+    # FOR NO KEY UPDATE: не конфликтует с KEY SHARE, который берут проверки внешних ключей
+    # при вставке в messages, chat_reads и chat_unread из других транзакций
+    chats = select(Chat.id).where(Chat.id.in_(chat_ids))
+    return chats.order_by(Chat.id).with_for_update(key_share=True)
+
+
+def _number(messages: 'List[ChatMessageCreateDto]', counts: 'Counter', bumped: 'List[Row]') -> 'List[int|None]':
+    """Номера по порядку в пачке, None - чат удалён после проверки участия и его нет в RETURNING."""
+    next_seqs = {}
+    for row in bumped:
+        next_seqs[row.id] = row.last_seq - counts[row.id]
+    seqs = []
+    for msg in messages:
+        if msg.chat_id not in next_seqs:
+            seqs.append(None)
+            continue
+        next_seqs[msg.chat_id] += 1
+        seqs.append(next_seqs[msg.chat_id])
+    return seqs
+
+
+async def _reserve_seqs(session: 'AsyncSession', messages: 'List[ChatMessageCreateDto]') -> 'List[int|None]':
+    """
+    Номера сообщений пачки в их чатах, по порядку внутри пачки.
+
+    Строки чатов блокируются по возрастанию id до конца транзакции, поэтому пачки
+    разных воркеров не ждут друг друга по кругу, а номера идут в порядке коммита.
+    """
+    counts = Counter(msg.chat_id for msg in messages)
+    await session.execute(_lock_chats_stmt(sorted(counts)))
+    result = await session.execute(_bump_seqs_stmt(counts))
+    return _number(messages, counts, result.all())
+
+
+def _message_rows(messages: 'List[ChatMessageCreateDto]', seqs: 'List[int|None]') -> 'List[Dict]':
+    return [
+        {
+            'id': uuid.uuid4(),
+            'sender_id': msg.sender_id,
+            'chat_id': msg.chat_id,
+            'text': msg.text,
+            'seq': seq,
+            # now() одинаков для всей транзакции, clock_timestamp() сохраняет порядок внутри пачки
+            'created_at': func.clock_timestamp(),
+            'updated_at': func.clock_timestamp(),
+        }
+        for msg, seq in zip(messages, seqs)
+        if seq is not None
+    ]
+
+
+def _outcomes(
+    messages: 'List[ChatMessageCreateDto]', seqs: 'List[int|None]', rows: 'List[Dict]', stored: 'Dict',
+) -> 'List[Outcome]':
+    """Результат для каждого сообщения пачки, по порядку."""
+    saved = iter(rows)
+    outcomes: 'List[Outcome]' = []
+    for msg, seq in zip(messages, seqs):
+        if seq is None:
+            outcomes.append(LookupError('Chat {0} not found'.format(msg.chat_id)))
+            continue
+        row = next(saved)
+        outcomes.append(ChatMessageDto(
+            id=row['id'],
+            sender_id=row['sender_id'],
+            chat_id=row['chat_id'],
+            text=row['text'],
+            seq=row['seq'],
+            created_at=stored[row['id']].created_at,
+            updated_at=stored[row['id']].updated_at,
+        ))
+    return outcomes
+
+
+def _settle(future: 'asyncio.Future', outcome: 'Outcome') -> None:
+    # отправитель мог уже уйти, отменив своё ожидание
+    if future.done():
+        return
+    if isinstance(outcome, Exception):
+        future.set_exception(outcome)
+    else:
+        future.set_result(outcome)
+
+
+class MessageWriteBatcher:
+    """
+    Group commit для новых сообщений.
+
+    Сообщения со всех сокетов копятся до `window` секунд (или до `max_size` штук)
+    и пишутся одним multi-row `INSERT ... RETURNING` в одной транзакции, вместе
+    с выдачей номеров сообщений в чатах и приращением счётчиков непрочитанных.
+    Пока идёт запись, следующие сообщения копятся в новую пачку.
+    """
+
+    _logger = get_logger('MessageWriteBatcher')
+
+    def __init__(self, sc: 'async_sessionmaker[AsyncSession]', window: 'float', max_size: 'int'):
+        self._sc = sc
+        self._window = window
+        self._max_size = max_size
+        self._pending: 'List[PendingMessage]' = []
+        self._has_pending = asyncio.Event()
+        self._is_full = asyncio.Event()
+        self._worker: 'asyncio.Task|None' = None
+
+    async def submit(self, msg: 'ChatMessageCreateDto') -> 'ChatMessageDto':
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((msg, future))
+        self._has_pending.set()
+        if len(self._pending) >= self._max_size:
+            self._is_full.set()
+        return await future
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        while self._pending:
+            await self._write(self._take_batch())
+
+    async def _run(self) -> None:
+        db_operation.set('message_batch')
+        while True:
+            await self._has_pending.wait()
+            try:
+                await asyncio.wait_for(self._is_full.wait(), timeout=self._window)
+            except TimeoutError:
+                self._logger.debug('Flush %d messages by timeout', len(self._pending))
+            await self._write(self._take_batch())
+
+    def _take_batch(self) -> 'List[PendingMessage]':
+        batch = self._pending[:self._max_size]
+        self._pending = self._pending[self._max_size:]
+        if len(self._pending) < self._max_size:
+            self._is_full.clear()
+        if not self._pending:
+            self._has_pending.clear()
+        return batch
+
+    async def _write(self, batch: 'List[PendingMessage]') -> None:
+        try:
+            outcomes = await self._insert([msg for msg, _ in batch])
+        except DBAPIError as exc:
+            if len(batch) == 1 or exc.connection_invalidated:
+                self._logger.error('Failed to save %d messages: %r', len(batch), exc)
+                outcomes = [exc for _ in batch]
+            else:
+                # строку, которую отвергла база, найдём поштучно: ошибку получит только её отправитель
+                self._logger.warning('Failed to save %d messages, retry one by one: %r', len(batch), exc)
+                for pending in batch:
+                    await self._write([pending])  # noqa: WPS476
+                return
+        except Exception as exc:  # noqa: B902
+            self._logger.error('Failed to save %d messages: %r', len(batch), exc)
+            outcomes = [exc for _ in batch]
+
+        for (_, future), outcome in zip(batch, outcomes):
+            _settle(future, outcome)
+
+    async def _insert(self, messages: 'List[ChatMessageCreateDto]') -> 'List[Outcome]':
+        async with self._sc() as session:
+            seqs = await _reserve_seqs(session, messages)
+            rows = _message_rows(messages, seqs)
+            stored = {}
+            if rows:
+                result = await session.execute(
+                    insert(Message).values(rows).returning(Message.id, Message.created_at, Message.updated_at),
+                )
+                stored = {row.id: row for row in result.all()}
+                await session.execute(increment_unread_stmt(list(stored)))
+            await session.commit()
+
+        return _outcomes(messages, seqs, rows, stored)
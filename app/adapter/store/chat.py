@@ -1,29 +1,90 @@
 from typing import TYPE_CHECKING
 
 from fastapi import HTTPException
-from sqlalchemy import insert, or_, select
+from sqlalchemy import (
+    delete, func, insert, literal_column, or_, select, type_coerce,
+)
+from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import selectinload
 from starlette import status
 
-from app.adapter.dto.chat import ChatDto
-from app.adapter.store.models import Chat, User, chat_participants
+from app.adapter.dto.chat import ChatDto, ChatMembershipDto
+from app.adapter.store.models import (
+    Chat, User, chat_participants, chat_reads, chat_unread,
+)
 
 if TYPE_CHECKING:
     from typing import List
     from uuid import UUID
 
+    from sqlalchemy.ext.asyncio import AsyncSession
+
     from app.adapter.dto.chat import ChatCreateDto
     from app.adapter.store.sql_adapter import DataBaseAdapter
 
 
+def _participants_json():
+    participant = func.json_build_object('id', User.id, 'email', User.email, 'username', User.username)
+    aggregated = func.coalesce(func.json_agg(participant), literal_column("'[]'::json"))
+    members = chat_participants.join(User, User.id == chat_participants.c.user_id)
+    participants = select(aggregated).select_from(members)
+    participants = participants.where(chat_participants.c.chat_id == Chat.id)
+    return type_coerce(participants.correlate(Chat).scalar_subquery(), JSON)
+
+
+def chats_query():
+    """Чаты плоскими строками, участники собираются в JSON массив на стороне базы."""
+    return select(
+        Chat.id,
+        Chat.chat_name,
+        Chat.chat_type,
+        Chat.owner_id,
+        _participants_json().label('participants'),
+    )
+
+
+def member_filter(user_id: 'UUID'):
+    """Условие на `Chat`: пользователь владелец или участник чата."""
+    return or_(
+        Chat.owner_id == user_id,
+        Chat.id.in_(
+            select(chat_participants.c.chat_id).where(chat_participants.c.user_id == user_id),
+        ),
+    )
+
+
+async def _forget_reads(session: 'AsyncSession', chat_id: 'UUID', user_id: 'UUID') -> None:
+    await session.execute(
+        delete(chat_reads).where(
+            chat_reads.c.chat_id == chat_id,
+            chat_reads.c.user_id == user_id,
+        ),
+    )
+    await session.execute(
+        delete(chat_unread).where(
+            chat_unread.c.chat_id == chat_id,
+            chat_unread.c.user_id == user_id,
+        ),
+    )
+
+
+def _chat_dto(row) -> 'ChatDto':
+    return ChatDto(
+        id=row.id,
+        chat_name=row.chat_name,
+        chat_type=row.chat_type,
+        owner_id=row.owner_id,
+        participants=row.participants,
+    )
+
+
 class ChatAdapter:
     async def create_chat(
             self: 'DataBaseAdapter',
             owner_id: 'UUID',
             chat: 'ChatCreateDto',
     ) -> 'ChatDto':
-        async with self._sc() as session:
+        async with self._session() as session:
             created_chat = Chat(
                 owner_id=owner_id,
                 chat_name=chat.chat_name,
@@ -45,63 +106,50 @@ class ChatAdapter:
 
             await session.commit()
             await session.refresh(created_chat)
+            self._membership_cache.invalidate(created_chat.id)
             return ChatDto.model_validate(created_chat)
 
     async def get_my_chats(self: 'DataBaseAdapter', user_id: 'UUID') -> 'List[ChatDto]':
-        async with self._sc() as session:
-            result = await session.execute(
-                select(Chat)
-                .outerjoin(chat_participants, Chat.id == chat_participants.c.chat_id)
-                .options(selectinload(Chat.participants))
-                .where(
-                    or_(
-                        Chat.owner_id == user_id,
-                        chat_participants.c.user_id == user_id,
-                    )
-                )
-            )
-            chats = result.scalars().unique().all()
-            return [ChatDto.model_validate(chat) for chat in chats]
+        async with self._session() as session:
+            result = await session.execute(chats_query().where(member_filter(user_id)))
+            return [_chat_dto(row) for row in result.all()]
 
     async def get_all_chats(self: 'DataBaseAdapter') -> 'List[ChatDto]':
-        async with self._sc() as session:
-            result = await session.execute(
-                select(Chat).options(selectinload(Chat.participants))
-            )
-            chats = result.scalars().all()
-            return [ChatDto.model_validate(chat) for chat in chats]
-
-    async def get_chat_by_id(self: 'DataBaseAdapter', chat_id: 'UUID') -> 'ChatDto|None':
-        async with self._sc() as session:
-            result = await session.execute(
-                select(Chat)
-                .options(selectinload(Chat.participants))
-                .where(Chat.id == chat_id)
-            )
-            chat = result.scalar_one_or_none()
-            if chat is None:
-                return None
-            return ChatDto.model_validate(chat)
-
-    async def get_chat_by_id_and_user_id(self: 'DataBaseAdapter', chat_id: 'UUID', user_id: 'UUID') -> 'ChatDto|None':
-        async with self._sc() as session:
-            result = await session.execute(
-                select(Chat)
-                .options(selectinload(Chat.participants))
-                .where(
-                    Chat.id == chat_id,
-                    or_(
-                        Chat.owner_id == user_id,
-                        Chat.participants.any(id=user_id)
-                    )
+        async with self._session() as session:
+            result = await session.execute(chats_query())
+            return [_chat_dto(row) for row in result.all()]
+
+    async def get_chat_membership(
+            self: 'DataBaseAdapter',
+            chat_id: 'UUID',
+            user_id: 'UUID',
+    ) -> 'ChatMembershipDto|None':
+        membership = self._membership_cache.get(chat_id)
+        if membership is None:
+            async with self._session() as session:
+                result = await session.execute(
+                    select(Chat.owner_id, chat_participants.c.user_id)
+                    .outerjoin(chat_participants, Chat.id == chat_participants.c.chat_id)
+                    .where(Chat.id == chat_id)
                 )
+                rows = result.all()
+
+            if not rows:
+                return None
+
+            membership = ChatMembershipDto(
+                chat_id=chat_id,
+                owner_id=rows[0].owner_id,
+                participant_ids=frozenset(row.user_id for row in rows if row.user_id is not None),
             )
+            self._membership_cache.set(chat_id, membership)
 
-            if (chat := result.scalar_one_or_none()) is not None:  # noqa: WPS332
-                return ChatDto.model_validate(chat, from_attributes=True)
+        if membership.is_member(user_id):
+            return membership
+        return None
 
     async def leave_chat(self: 'DataBaseAdapter', chat_id: 'UUID', user_id: 'UUID') -> 'bool':
-        async with self._sc() as session:
+        async with self._session() as session:
             chat = await session.get(Chat, chat_id)
             user = await session.get(User, user_id)
 
@@ -114,9 +162,10 @@ class ChatAdapter:
             if chat.owner_id == user_id:
                 chat.participants.clear()
                 await session.delete(chat)
-                await session.commit()
-                return True
+            else:
+                chat.participants.remove(user)
+                await _forget_reads(session, chat_id, user_id)
 
-            chat.participants.remove(user)
             await session.commit()
+            self._membership_cache.invalidate(chat_id)
             return True
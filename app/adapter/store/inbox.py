@@ -0,0 +1,121 @@
+from typing import TYPE_CHECKING
+
+from sqlalchemy import and_, func, select, true, tuple_
+
+from app.adapter.dto.chat import (
+    ChatHistoryMessageDto, InboxChatDto, InboxCursor, InboxPageDto,
+)
+from app.adapter.dto.user import UserDto
+from app.adapter.store.chat import chats_query, member_filter
+from app.adapter.store.models import Chat, Message, User, chat_unread
+
+if TYPE_CHECKING:
+    from typing import Dict
+    from uuid import UUID
+
+    from sqlalchemy import Row
+
+    from app.adapter.store.sql_adapter import DataBaseAdapter
+
+
+def _last_message():
+    """Последнее сообщение чата: один шаг назад по индексу (chat_id, created_at, id)."""
+    return (
+        select(
+            Message.id.label('last_id'),
+            Message.text.label('last_text'),
+            Message.seq.label('last_seq'),
+            Message.created_at.label('last_created_at'),
+            Message.updated_at.label('last_updated_at'),
+            User.id.label('last_sender_id'),
+            User.email.label('last_sender_email'),
+            User.username.label('last_sender_username'),
+        )
+        .join(User, User.id == Message.sender_id)
+        .where(Message.chat_id == Chat.id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+        .lateral('last_message')
+    )
+
+
+def _inbox_query(user_id: 'UUID', limit: int, after: 'InboxCursor|None'):
+    """Чаты пользователя с последним сообщением и счётчиком непрочитанных, от недавних к давним."""
+    last = _last_message()
+    activity = func.coalesce(last.c.last_created_at, Chat.created_at)
+    query = chats_query().select_from(Chat).add_columns(
+        *last.c,
+        func.coalesce(chat_unread.c.unread, 0).label('unread'),
+        activity.label('activity_at'),
+    )
+    query = (
+        query
+        .outerjoin(last, true())
+        .outerjoin(chat_unread, and_(
+            chat_unread.c.chat_id == Chat.id,
+            chat_unread.c.user_id == user_id,
+        ))
+        .where(member_filter(user_id))
+        .order_by(activity.desc(), Chat.id.desc())
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.where(_active_before(activity, after))
+    return query
+
+
+def _active_before(activity, after: 'InboxCursor'):
+    position = tuple_(activity, Chat.id)
+    return position < tuple_(after.activity_at, after.chat_id)
+
+
+def _inbox_chat(row: 'Row') -> 'InboxChatDto':
+    last_message = None
+    if row.last_id is not None:
+        last_message = ChatHistoryMessageDto(
+            id=row.last_id,
+            chat_id=row.id,
+            text=row.last_text,
+            seq=row.last_seq,
+            sender=UserDto(id=row.last_sender_id, email=row.last_sender_email, username=row.last_sender_username),
+            created_at=row.last_created_at,
+            updated_at=row.last_updated_at,
+        )
+    return InboxChatDto(
+        id=row.id,
+        chat_name=row.chat_name,
+        chat_type=row.chat_type,
+        owner_id=row.owner_id,
+        participants=row.participants,
+        last_message=last_message,
+        unread=row.unread,
+        activity_at=row.activity_at,
+    )
+
+
+class InboxAdapter:
+    async def get_inbox(
+            self: 'DataBaseAdapter',
+            user_id: 'UUID',
+            limit: int = 50,
+            after: 'InboxCursor|None' = None,
+    ) -> 'InboxPageDto':
+        async with self._session() as session:
+            result = await session.execute(_inbox_query(user_id, limit + 1, after))
+            rows = list(result.all())
+
+        page = InboxPageDto(chats=[_inbox_chat(row) for row in rows[:limit]])
+        if len(rows) > limit:
+            last = page.chats[-1]
+            page.after = InboxCursor(activity_at=last.activity_at, chat_id=last.chat_id)
+        return page
+
+    async def get_unread_counts(self: 'DataBaseAdapter', user_id: 'UUID') -> 'Dict[UUID, int]':
+        async with self._session() as session:
+            result = await session.execute(
+                select(chat_unread.c.chat_id, chat_unread.c.unread).where(
+                    chat_unread.c.user_id == user_id,
+                    chat_unread.c.unread > 0,
+                ),
+            )
+            return {row.chat_id: row.unread for row in result.all()}
@@ -0,0 +1,64 @@
+import inspect
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+from sqlalchemy import event
+
+from app.metrics import db_method_seconds, db_query_seconds
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Type, TypeVar
+
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+    AdapterT = TypeVar('AdapterT')
+
+# метод адаптера, от имени которого сейчас идут запросы
+db_operation: 'ContextVar[str]' = ContextVar('db_operation', default='other')
+
+
+def instrument_engine(engine: 'AsyncEngine') -> None:
+    """Время каждого SQL запроса с меткой текущего метода адаптера."""
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def instrument_methods(cls: 'Type[AdapterT]') -> 'Type[AdapterT]':
+    """Оборачивает публичные корутины адаптера замером времени и меткой `db_operation`."""
+    for name, method in inspect.getmembers(cls, inspect.iscoroutinefunction):
+        if not name.startswith('_'):
+            setattr(cls, name, _timed(name, method))
+    return cls
+
+
+class _Operation:
+    def __init__(self, name: 'str'):
+        self._name = name
+        self._token = None
+        self._started = 0
+
+    def __enter__(self) -> None:
+        self._token = db_operation.set(self._name)
+        self._started = perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        db_method_seconds.observe(perf_counter() - self._started, (self._name,))
+        db_operation.reset(self._token)
+
+
+def _timed(name: 'str', method: 'Callable[..., Any]') -> 'Callable[..., Any]':
+    @wraps(method)
+    async def wrapper(*args, **kwargs):
+        with _Operation(name):
+            return await method(*args, **kwargs)
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:  # noqa: WPS211
+    context.query_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:  # noqa: WPS211
+    db_query_seconds.observe(perf_counter() - context.query_started, (db_operation.get(),))
@@ -1,94 +1,199 @@
 from typing import TYPE_CHECKING
 
 from fastapi import WebSocketException
-from sqlalchemy import exists, literal, or_, select
-from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy.orm import selectinload
+from sqlalchemy import func, select, tuple_
 from starlette import status
 
 from app.adapter.dto.chat import (
-    ChatHistoryMessageDto, ChatMessageCreateDto, ChatMessageDto,
-)
-from app.adapter.store.models import (
-    Chat, Message, User, chat_participants, messages_read,
+    ChatHistoryMessageDto, ChatHistoryPageDto, ChatMessageCreateDto,
+    ChatMessageDto, ChatSearchPageDto, MessageCursor, SearchCursor,
 )
+from app.adapter.dto.user import UserDto
+from app.adapter.recent import recent_messages
+from app.adapter.store.chat import member_filter
+from app.adapter.store.models import Chat, Message, User, chat_reads
+from app.adapter.store.receipts import save_watermarks
 
 if TYPE_CHECKING:
-    from typing import List
+    from datetime import datetime
+    from typing import List, Tuple
     from uuid import UUID
 
+    from sqlalchemy import Row
+    from sqlalchemy.ext.asyncio import AsyncSession
+
     from app.adapter.store.sql_adapter import DataBaseAdapter
 
 
+def _cursor(message: 'ChatHistoryMessageDto') -> 'MessageCursor':
+    return MessageCursor(created_at=message.created_at, message_id=message.message_id)
+
+
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.chat_id,
+    Message.text,
+    Message.seq,
+    Message.created_at,
+    Message.updated_at,
+    User.id.label('sender_id'),
+    User.email.label('sender_email'),
+    User.username.label('sender_username'),
+)
+
+
+def _history_message(row: 'Row', readers: 'List[UserDto]') -> 'ChatHistoryMessageDto':
+    return ChatHistoryMessageDto(
+        id=row.id,
+        chat_id=row.chat_id,
+        text=row.text,
+        seq=row.seq,
+        sender=UserDto(id=row.sender_id, email=row.sender_email, username=row.sender_username),
+        created_at=row.created_at,
+        updated_at=row.updated_at,
+        readers=readers,
+    )
+
+
+def _history_query(chat_id: 'UUID', limit: int, before: 'MessageCursor|None', after: 'MessageCursor|None'):
+    position = tuple_(Message.created_at, Message.id)
+    query = (
+        select(*MESSAGE_COLUMNS)
+        .join(User, User.id == Message.sender_id)
+        .where(Message.chat_id == chat_id)
+        .limit(limit)
+    )
+    if after is not None:
+        return query.where(
+            position > tuple_(after.created_at, after.message_id),
+        ).order_by(Message.created_at, Message.id)
+
+    if before is not None:
+        query = query.where(position < tuple_(before.created_at, before.message_id))
+    return query.order_by(Message.created_at.desc(), Message.id.desc())
+
+
+def _search_query(user_id: 'UUID', text: str, chat_id: 'UUID|None', limit: int, after: 'SearchCursor|None'):
+    """Совпадения по GIN индексу в чатах пользователя, от релевантных к менее, затем от новых к старым."""
+    tsquery = func.websearch_to_tsquery('simple', text)
+    rank = func.ts_rank(Message.search_vector, tsquery)
+    ranked = rank.label('rank')
+    query = (
+        select(*MESSAGE_COLUMNS, ranked)
+        .join(User, User.id == Message.sender_id)
+        .where(
+            Message.search_vector.bool_op('@@')(tsquery),
+            Message.chat_id.in_(select(Chat.id).where(member_filter(user_id))),
+        )
+        .order_by(rank.desc(), Message.created_at.desc(), Message.id.desc())
+        .limit(limit)
+    )
+    if chat_id is not None:
+        query = query.where(Message.chat_id == chat_id)
+    if after is not None:
+        query = query.where(_ranked_after(rank, after))
+    return query
+
+
+def _ranked_after(rank, after: 'SearchCursor'):
+    position = tuple_(rank, Message.created_at, Message.id)
+    return position < tuple_(after.rank, after.created_at, after.message_id)
+
+
+def _search_cursor(row: 'Row') -> 'SearchCursor':
+    return SearchCursor(rank=row.rank, created_at=row.created_at, message_id=row.id)
+
+
+async def _chat_watermarks(session: 'AsyncSession', chat_id: 'UUID') -> 'List[Tuple[UserDto, datetime]]':
+    result = await session.execute(
+        select(
+            User.id,
+            User.email,
+            User.username,
+            chat_reads.c.last_read_at,
+        )
+        .join(chat_reads, chat_reads.c.user_id == User.id)
+        .where(chat_reads.c.chat_id == chat_id)
+    )
+    return [(UserDto.model_validate(row), row.last_read_at) for row in result.all()]
+
+
+def _readers_at(watermarks: 'List[Tuple[UserDto, datetime]]', created_at: 'datetime') -> 'List[UserDto]':
+    return [user for user, last_read_at in watermarks if last_read_at >= created_at]
+
+
 class MessageAdapter:
     async def save_message(
             self: 'DataBaseAdapter',
             msg: 'ChatMessageCreateDto',
     ) -> 'ChatMessageDto':
-        async with self._sc() as session:
-            m_message = Message(
-                sender_id=msg.sender_id,
-                chat_id=msg.chat_id,
-                text=msg.text,
-            )
-            session.add(m_message)
-            await session.commit()
-            await session.refresh(
-                m_message,
-                attribute_names=['readers', 'created_at', 'updated_at'],
-            )
-
-            return ChatMessageDto.model_validate(m_message)
+        return await self._message_batcher.submit(msg)
 
     async def get_messages_by_chat_and_user_id(
             self: 'DataBaseAdapter',
             chat_id: 'UUID',
             user_id: 'UUID',
-            offset: int = 0,
-            limit: int = 5,
+            limit: int = 50,
+            before: 'MessageCursor|None' = None,
+            after: 'MessageCursor|None' = None,
+    ) -> 'ChatHistoryPageDto':
+        if await self.get_chat_membership(chat_id, user_id) is None:
+            return ChatHistoryPageDto(messages=[], after=after)
+
+        # первая страница активного чата обычно уже есть в памяти
+        messages = None
+        if before is None and after is None:
+            messages = recent_messages.page(chat_id, limit)
+        if messages is None:
+            messages, has_more = await self._read_history(chat_id, limit, before, after)
+        else:
+            has_more = messages[0].seq > 1
+
+        if not messages:
+            return ChatHistoryPageDto(messages=[], after=after)
+
+        self._receipt_recorder.record(chat_id, user_id, messages[-1].created_at)
+
+        return ChatHistoryPageDto(
+            messages=messages,
+            before=_cursor(messages[0]) if has_more or after is not None else None,
+            after=_cursor(messages[-1]),
+        )
+
+    async def search_messages(
+            self: 'DataBaseAdapter',
+            user_id: 'UUID',
+            text: str,
+            chat_id: 'UUID|None' = None,
+            limit: int = 50,
+            after: 'SearchCursor|None' = None,
+    ) -> 'ChatSearchPageDto':
+        async with self._session() as session:
+            query = _search_query(user_id, text, chat_id, limit + 1, after)
+            messages = list((await session.execute(query)).all())
+
+        found = [_history_message(msg, []) for msg in messages[:limit]]
+        page = ChatSearchPageDto(messages=found)
+        if len(messages) > limit:
+            page.after = _search_cursor(messages[limit - 1])
+        return page
+
+    async def get_messages_since(
+            self: 'DataBaseAdapter',
+            chat_id: 'UUID',
+            after_seq: int,
+            limit: int,
     ) -> 'List[ChatHistoryMessageDto]':
-        async with self._sc() as session:
-            message_ids_subq = (
-                select(Message.id)
-                .join(Chat)
-                .where(
-                    Message.chat_id == chat_id,
-                    or_(
-                        Chat.owner_id == user_id,
-                        exists().where(
-                            chat_participants.c.chat_id == chat_id,
-                            chat_participants.c.user_id == user_id
-                        )
-                    )
-                )
-                .offset(offset)
-                .limit(limit)
-                .subquery()
-            )
-
-            stmt = insert(messages_read).from_select(
-                ['message_id', 'user_id'],
-                select(
-                    message_ids_subq.c.id,
-                    literal(user_id)
-                )
-            ).on_conflict_do_update(
-                index_elements=['message_id', 'user_id'],
-                set_=dict(user_id=user_id)
+        """Сообщения чата с номерами после `after_seq`, по возрастанию, по индексу (chat_id, seq)."""
+        async with self._session() as session:
+            result = await session.execute(
+                select(*MESSAGE_COLUMNS)
+                .join(User, User.id == Message.sender_id)
+                .where(Message.chat_id == chat_id, Message.seq > after_seq)
+                .order_by(Message.seq)
+                .limit(limit),
             )
-
-            await session.execute(stmt)
-            await session.commit()
-
-            query = (
-                select(Message).options(
-                    selectinload(Message.readers),
-                    selectinload(Message.sender),
-                    selectinload(Message.chat).selectinload(Chat.participants),
-                ).where(Message.id.in_(select(message_ids_subq.c.id))))
-
-            result = await session.execute(query)
-            return [ChatHistoryMessageDto.model_validate(msg) for msg in result.scalars().all()]
+            return [_history_message(row, []) for row in result.all()]
 
     async def add_reader(
             self: 'DataBaseAdapter',
@@ -96,35 +201,55 @@ class MessageAdapter:
             message_id: 'UUID',
             user_id: 'UUID',
     ) -> 'ChatMessageDto':
-        async with self._sc() as session:
-            stmt = (
-                select(Message)
-                .join(Message.chat)
-                .options(
-                    selectinload(Message.readers),
-                    selectinload(Message.chat).selectinload(Chat.participants)
-                )
-                .where(
-                    Message.id == message_id,
-                    Message.chat_id == chat_id,
-                    or_(
-                        Chat.owner_id == user_id,
-                        Chat.participants.any(id=user_id)
-                    )
-                )
+        membership = await self.get_chat_membership(chat_id, user_id)
+        async with self._session() as session:
+            result = await session.execute(
+                select(
+                    Message.id, Message.chat_id, Message.sender_id, Message.text,
+                    Message.created_at, Message.updated_at,
+                ).where(Message.id == message_id, Message.chat_id == chat_id)
             )
-            result = await session.execute(stmt)
-            message = result.scalar_one_or_none()
-            if message is None:
+            message = result.one_or_none()
+            if message is None or membership is None:
                 raise WebSocketException(
                     code=status.WS_1003_UNSUPPORTED_DATA,
                     reason='Message not in chat or user not a participant',
                 )
 
-            user = await session.get(User, user_id)
-            message.readers.append(user)
-
+            await save_watermarks(session, [
+                {'chat_id': chat_id, 'user_id': user_id, 'last_read_at': message.created_at},
+            ])
             await session.commit()
-            await session.refresh(message)
 
-            return ChatMessageDto.model_validate(message, from_attributes=True)
+            readers = _readers_at(await _chat_watermarks(session, chat_id), message.created_at)
+            return ChatMessageDto(
+                id=message.id,
+                chat_id=message.chat_id,
+                sender_id=message.sender_id,
+                text=message.text,
+                created_at=message.created_at,
+                updated_at=message.updated_at,
+                readers=readers,
+            )
+
+    async def _read_history(
+            self: 'DataBaseAdapter',
+            chat_id: 'UUID',
+            limit: int,
+            before: 'MessageCursor|None',
+            after: 'MessageCursor|None',
+    ) -> 'Tuple[List[ChatHistoryMessageDto], bool]':
+        async with self._session() as session:
+            query = _history_query(chat_id, limit + 1, before, after)
+            rows = list((await session.execute(query)).all())
+            watermarks = await _chat_watermarks(session, chat_id)
+
+        messages = [
+            _history_message(row, _readers_at(watermarks, row.created_at))
+            for row in rows[:limit]
+        ]
+        if after is None:
+            messages.reverse()
+        if before is None and after is None:
+            recent_messages.put(chat_id, messages, watermarks)
+        return messages, len(rows) > limit
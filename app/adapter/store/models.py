@@ -1,34 +1,76 @@
 import uuid
 
 from sqlalchemy import (  # noqa: WPS235
-    Boolean, Column, DateTime, Enum as SqlAlchemyEnum, ForeignKey, String,
-    Table, Text, UniqueConstraint, func,
+    BigInteger, Boolean, Column, Computed, DateTime, Enum as SqlAlchemyEnum,
+    ForeignKey, Index, Integer, PrimaryKeyConstraint, String, Table, Text,
+    UniqueConstraint, func,
 )
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
+from sqlalchemy.orm import declarative_base, deferred, relationship
 
 from app.adapter.dto.chat import ChatType
 
 Base = declarative_base()
 
+UUID_TYPE = UUID(as_uuid=True)
+
 
 chat_participants = Table(
     'chat_participants',
     Base.metadata,
-    Column('chat_id', UUID(as_uuid=True), ForeignKey('chats.id'), primary_key=True),
-    Column('user_id', UUID(as_uuid=True), ForeignKey('users.id'), primary_key=True),
+    Column('chat_id', UUID_TYPE, ForeignKey('chats.id'), primary_key=True),
+    Column('user_id', UUID_TYPE, ForeignKey('users.id'), primary_key=True),
+)
+
+# Отметка прочтения: всё, что создано в чате не позже last_read_at, пользователь прочитал
+chat_reads = Table(
+    'chat_reads',
+    Base.metadata,
+    Column('chat_id', UUID_TYPE, ForeignKey('chats.id', ondelete='CASCADE'), primary_key=True),
+    Column('user_id', UUID_TYPE, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    Column('last_read_at', DateTime, nullable=False),
+)
+
+# Непрочитанные сообщения от других участников после отметки прочтения; нет строки - ноль
+chat_unread = Table(
+    'chat_unread',
+    Base.metadata,
+    Column('chat_id', UUID_TYPE, ForeignKey('chats.id', ondelete='CASCADE'), nullable=False),
+    Column('user_id', UUID_TYPE, ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+    Column('unread', Integer, nullable=False, default=0),
+    # счётчики читаются по пользователю
+    PrimaryKeyConstraint('user_id', 'chat_id'),
+)
+
+# События шины postgres, которые не влезают в NOTIFY: в уведомлении идёт только id строки
+fanout_payloads = Table(
+    'fanout_payloads',
+    Base.metadata,
+    Column('id', BigInteger, primary_key=True, autoincrement=True),
+    Column('payload', Text, nullable=False),
+    Column('created_at', DateTime, nullable=False, server_default=func.now()),
+)
+
+# Воркеры, которые держат присутствие в chat_presence; не продлевает seen_at - его присутствие снимается
+presence_workers = Table(
+    'presence_workers',
+    Base.metadata,
+    Column('id', UUID_TYPE, primary_key=True),
+    Column('seen_at', DateTime, nullable=False, server_default=func.now()),
 )
 
-messages_read = Table(
-    'messages_read',
+# Пользователь в чате хотя бы одним сокетом этого воркера
+chat_presence = Table(
+    'chat_presence',
     Base.metadata,
-    Column('message_id', UUID(as_uuid=True), ForeignKey('messages.id'), primary_key=True),
-    Column('user_id', UUID(as_uuid=True), ForeignKey('users.id'), primary_key=True),
+    Column('chat_id', UUID_TYPE, ForeignKey('chats.id', ondelete='CASCADE'), primary_key=True),
+    Column('user_id', UUID_TYPE, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    Column('worker_id', UUID_TYPE, ForeignKey('presence_workers.id', ondelete='CASCADE'), primary_key=True),
 )
 
 
 class BaseMixin:
-    id = Column('id', UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column('id', UUID_TYPE, primary_key=True, default=uuid.uuid4)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -48,9 +90,11 @@ class User(Base, BaseMixin):
 class Chat(Base, BaseMixin):
     __tablename__ = 'chats'
 
-    owner_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
+    owner_id = Column(UUID_TYPE, ForeignKey('users.id'), nullable=True)
     chat_name = Column('chat_name', String(50), nullable=False)
     chat_type = Column('chat_type', SqlAlchemyEnum(ChatType), nullable=False)
+    # последний выданный номер сообщения в чате
+    last_seq = Column('last_seq', BigInteger, nullable=False, default=0, server_default='0')
 
     owner = relationship('User', backref='chats')
 
@@ -67,7 +111,7 @@ class UserJwt(BaseMixin, Base):
 
     token = Column('token', String(1024), nullable=False, unique=True)
     never_expired = Column('never_expired', Boolean, default=False, nullable=False)
-    owner_id = Column(UUID(as_uuid=True), ForeignKey('users.id'))
+    owner_id = Column(UUID_TYPE, ForeignKey('users.id'))
 
     owner = relationship('User', backref='tokens')
 
@@ -75,16 +119,20 @@ class UserJwt(BaseMixin, Base):
 class Message(Base, BaseMixin):
     __tablename__ = 'messages'
 
-    chat_id = Column(UUID(as_uuid=True), ForeignKey('chats.id'), nullable=True)
-    sender_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
+    chat_id = Column(UUID_TYPE, ForeignKey('chats.id'), nullable=True)
+    sender_id = Column(UUID_TYPE, ForeignKey('users.id'), nullable=True)
     text = Column('text', Text, nullable=False)
+    # номер сообщения в чате: 1, 2, 3... в порядке коммита
+    seq = Column('seq', BigInteger, nullable=False)
+    # словарь 'simple': без стемминга, одинаково для любого языка; в ORM сущность не грузится
+    search_vector = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', text)", persisted=True)))
 
     chat = relationship('Chat', backref='messages')
     sender = relationship('User', backref='messages')
 
-    readers = relationship(
-        'User',
-        secondary=messages_read,
-        backref='read_messages',
-        lazy='selectin',
+    __table_args__ = (
+        # keyset пагинация истории чата по (created_at, id)
+        Index('ix_messages_chat_id_created_at_id', 'chat_id', 'created_at', 'id'),
+        Index('ix_messages_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('ix_messages_chat_id_seq', 'chat_id', 'seq', unique=True),
     )
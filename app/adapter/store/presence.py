@@ -0,0 +1,126 @@
+from datetime import timedelta
+from typing import TYPE_CHECKING
+
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from app.adapter.store.models import chat_presence, presence_workers
+
+if TYPE_CHECKING:
+    from typing import List, Tuple
+    from uuid import UUID
+
+    from sqlalchemy import Column
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.sql import ColumnElement
+
+    from app.adapter.store.sql_adapter import DataBaseAdapter
+
+SIGNED_BIGINT = 1 << 63
+PRESENCE_PAIR = tuple_(chat_presence.c.chat_id, chat_presence.c.user_id)
+
+
+def _lock_key(chat_id: 'UUID', user_id: 'UUID') -> 'int':
+    """Ключ advisory lock пары (чат, пользователь) в диапазоне bigint."""
+    return (chat_id.int ^ user_id.int) % (SIGNED_BIGINT * 2) - SIGNED_BIGINT
+
+
+async def _lock_pair(session: 'AsyncSession', chat_id: 'UUID', user_id: 'UUID') -> None:
+    # входы и выходы одного пользователя в одном чате из разных воркеров идут по очереди
+    await session.execute(select(func.pg_advisory_xact_lock(_lock_key(chat_id, user_id))))
+
+
+async def _workers(session: 'AsyncSession', chat_id: 'UUID', user_id: 'UUID') -> 'int':
+    return await session.scalar(
+        select(func.count()).select_from(chat_presence).where(
+            chat_presence.c.chat_id == chat_id,
+            chat_presence.c.user_id == user_id,
+        ),
+    )
+
+
+def _of_dead_workers(worker_id: 'Column', ttl: 'timedelta') -> 'ColumnElement':
+    stale = presence_workers.c.seen_at < func.now() - ttl
+    return worker_id.in_(select(presence_workers.c.id).where(stale))
+
+
+async def _sweep(session: 'AsyncSession', ttl: 'timedelta') -> 'List[Tuple[UUID, UUID]]':
+    swept = delete(chat_presence).where(_of_dead_workers(chat_presence.c.worker_id, ttl))
+    result = await session.execute(swept.returning(*PRESENCE_PAIR.clauses))
+    lost = set(result.tuples())
+    forgotten = delete(presence_workers).where(_of_dead_workers(presence_workers.c.id, ttl))
+    await session.execute(forgotten)
+    if lost:
+        # пользователь мог остаться в чате через сокет живого воркера
+        alive = select(*PRESENCE_PAIR.clauses).where(PRESENCE_PAIR.in_(lost))
+        result = await session.execute(alive)
+        lost -= set(result.tuples())
+    return sorted(lost)
+
+
+class PresenceAdapter:
+    """
+    Присутствие в чатах, общее для всех воркеров.
+
+    Воркер хранит строку (чат, пользователь, воркер), пока в чате есть хотя бы один
+    сокет пользователя в этом воркере. `enter_presence`/`exit_presence` возвращают,
+    появился ли пользователь в чате или пропал из него во всех воркерах сразу.
+    """
+
+    async def enter_presence(self: 'DataBaseAdapter', worker_id: 'UUID', chat_id: 'UUID', user_id: 'UUID') -> 'bool':
+        async with self._session() as session:
+            await _lock_pair(session, chat_id, user_id)
+            await session.execute(
+                insert(chat_presence)
+                .values(chat_id=chat_id, user_id=user_id, worker_id=worker_id)
+                .on_conflict_do_nothing(),
+            )
+            workers = await _workers(session, chat_id, user_id)
+            await session.commit()
+            return workers == 1
+
+    async def exit_presence(self: 'DataBaseAdapter', worker_id: 'UUID', chat_id: 'UUID', user_id: 'UUID') -> 'bool':
+        async with self._session() as session:
+            await _lock_pair(session, chat_id, user_id)
+            result = await session.execute(
+                delete(chat_presence)
+                .where(
+                    chat_presence.c.chat_id == chat_id,
+                    chat_presence.c.user_id == user_id,
+                    chat_presence.c.worker_id == worker_id,
+                )
+                .returning(chat_presence.c.worker_id),
+            )
+            removed = result.first() is not None
+            workers = await _workers(session, chat_id, user_id)
+            await session.commit()
+            return removed and workers == 0
+
+    async def online_users(self: 'DataBaseAdapter', chat_id: 'UUID') -> 'List[UUID]':
+        async with self._session() as session:
+            result = await session.execute(
+                select(chat_presence.c.user_id).where(chat_presence.c.chat_id == chat_id).distinct(),
+            )
+            return list(result.scalars())
+
+    async def refresh_presence(self: 'DataBaseAdapter', worker_id: 'UUID', ttl: 'float') -> 'List[Tuple[UUID, UUID]]':
+        """
+        Продлевает присутствие воркера и снимает присутствие воркеров, молчащих дольше `ttl` секунд.
+
+        Возвращает пары (чат, пользователь), которые после этого не остались ни в одном воркере.
+        """
+        async with self._session() as session:
+            await session.execute(
+                insert(presence_workers)
+                .values(id=worker_id)
+                .on_conflict_do_update(index_elements=[presence_workers.c.id], set_={'seen_at': func.now()}),
+            )
+            lost = await _sweep(session, timedelta(seconds=ttl))
+            await session.commit()
+            return lost
+
+    async def drop_presence(self: 'DataBaseAdapter', worker_id: 'UUID') -> None:
+        async with self._session() as session:
+            worker = presence_workers.c.id == worker_id
+            await session.execute(delete(presence_workers).where(worker))
+            await session.commit()
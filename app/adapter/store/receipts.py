@@ -0,0 +1,131 @@
+import asyncio
+from operator import itemgetter
+from typing import TYPE_CHECKING
+
+from sqlalchemy import and_, column, func, select, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+
+from app.adapter.store.instrument import db_operation
+from app.adapter.store.models import chat_participants, chat_reads
+from app.adapter.store.unread import (
+    create_unread_stmt, lock_unread_stmt, refresh_unread_stmt,
+)
+from app.logger import get_logger
+
+if TYPE_CHECKING:
+    from datetime import datetime
+    from typing import Dict, List, Tuple
+    from uuid import UUID
+
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+    Receipts = Dict[Tuple[UUID, UUID], datetime]
+
+
+def upsert_watermarks_stmt(rows: 'List[Dict]'):
+    """
+    Сдвигает отметки только текущим участникам чатов, RETURNING - записанные (chat_id, user_id).
+
+    Отметка вышедшего пользователя или удалённого чата, которая ещё ждала записи, отбрасывается.
+    """
+    fields = itemgetter(*chat_reads.c.keys())
+    columns = [column(col.name, col.type) for col in chat_reads.c]
+    receipts = values(*columns, name='receipts')
+    receipts = receipts.data([fields(row) for row in rows])
+    members = (
+        select(*receipts.c)
+        .join(chat_participants, and_(
+            chat_participants.c.chat_id == receipts.c.chat_id,
+            chat_participants.c.user_id == receipts.c.user_id,
+        ))
+        .order_by(receipts.c.chat_id, receipts.c.user_id)
+    )
+    stmt = insert(chat_reads).from_select(['chat_id', 'user_id', 'last_read_at'], members)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[chat_reads.c.chat_id, chat_reads.c.user_id],
+        set_={'last_read_at': func.greatest(chat_reads.c.last_read_at, stmt.excluded.last_read_at)},
+    )
+    return stmt.returning(chat_reads.c.chat_id, chat_reads.c.user_id)
+
+
+async def save_watermarks(session: 'AsyncSession', rows: 'List[Dict]') -> None:
+    """Сдвигает отметки прочтения и пересчитывает по ним счётчики непрочитанных."""
+    result = await session.execute(upsert_watermarks_stmt(rows))
+    keys = [(row.chat_id, row.user_id) for row in result.all()]
+    if not keys:
+        return
+    await session.execute(create_unread_stmt(keys))
+    await session.execute(lock_unread_stmt(keys))
+    await session.execute(refresh_unread_stmt(keys))
+
+
+class ReceiptRecorder:
+    """
+    Отложенная запись отметок прочтения.
+
+    `record` ничего не ждёт: отметки одного пользователя в одном чате схлопываются
+    до самой поздней, а раз в `interval` секунд всё накопленное пишется одним upsert.
+    Если база отвергла пачку, отметки пишутся по одной, а отвергнутая отбрасывается.
+    """
+
+    _logger = get_logger('ReceiptRecorder')
+
+    def __init__(self, sc: 'async_sessionmaker[AsyncSession]', interval: 'float'):
+        self._sc = sc
+        self._interval = interval
+        self._pending: 'Dict[Tuple[UUID, UUID], datetime]' = {}
+        self._worker: 'asyncio.Task|None' = None
+
+    def record(self, chat_id: 'UUID', user_id: 'UUID', read_at: 'datetime') -> None:
+        key = (chat_id, user_id)
+        current = self._pending.get(key)
+        if current is None or current < read_at:
+            self._pending[key] = read_at
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch = self._pending
+        self._pending = {}
+        await self._save(batch)
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        await self.flush()
+
+    async def _run(self) -> None:
+        db_operation.set('receipt_flush')
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.flush()
+
+    async def _save(self, batch: 'Receipts') -> None:
+        try:
+            async with self._sc() as session:
+                await save_watermarks(session, [
+                    {'chat_id': chat_id, 'user_id': user_id, 'last_read_at': read_at}
+                    for (chat_id, user_id), read_at in batch.items()
+                ])
+                await session.commit()
+        except DBAPIError as exc:
+            if exc.connection_invalidated:
+                self._retry_later(batch, exc)
+            elif len(batch) == 1:
+                self._logger.error('Drop receipt %s: %r', next(iter(batch)), exc)
+            else:
+                # строку, которую отвергла база, найдём поштучно, остальные отметки запишутся
+                self._logger.warning('Failed to save %d receipts, retry one by one: %r', len(batch), exc)
+                for key, read_at in batch.items():
+                    await self._save({key: read_at})  # noqa: WPS476
+        except Exception as exc:  # noqa: B902
+            self._retry_later(batch, exc)
+
+    def _retry_later(self, batch: 'Receipts', exc: 'Exception') -> None:
+        self._logger.error('Failed to save %d receipts, retry later: %r', len(batch), exc)
+        for (chat_id, user_id), read_at in batch.items():
+            self.record(chat_id, user_id, read_at)
@@ -0,0 +1,99 @@
+from contextvars import ContextVar
+from typing import TYPE_CHECKING
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.settings import (
+    WS_DATA_BASE_DSN, WS_DATA_BASE_ECHO, WS_DATA_BASE_MAX_OVERFLOW,
+    WS_DATA_BASE_POOL_PRE_PING, WS_DATA_BASE_POOL_RECYCLE,
+    WS_DATA_BASE_POOL_SIZE, WS_DATA_BASE_STATEMENT_CACHE_SIZE,
+)
+
+if TYPE_CHECKING:
+    from contextvars import Token
+
+    from sqlalchemy.ext.asyncio import (
+        AsyncConnection, AsyncEngine, AsyncSession, async_sessionmaker,
+    )
+
+_current: 'ContextVar[UnitOfWork|None]' = ContextVar('unit_of_work', default=None)
+
+
+# group commit сообщений и запись отметок прочтения - по одной фоновой задаче
+WRITER_POOL_SIZE = 2
+
+
+def create_engine(
+    pool_size: 'int' = WS_DATA_BASE_POOL_SIZE, max_overflow: 'int' = WS_DATA_BASE_MAX_OVERFLOW,
+) -> 'AsyncEngine':
+    return create_async_engine(
+        WS_DATA_BASE_DSN,
+        echo=WS_DATA_BASE_ECHO,
+        future=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=WS_DATA_BASE_POOL_PRE_PING,
+        pool_recycle=WS_DATA_BASE_POOL_RECYCLE,
+        connect_args={'prepared_statement_cache_size': WS_DATA_BASE_STATEMENT_CACHE_SIZE},
+    )
+
+
+class UnitOfWork:
+    """
+    Одно соединение из пула на всё WebSocket событие или HTTP запрос.
+
+    Соединение берётся при первом обращении к базе и возвращается в пул при выходе.
+    Методы адаптера по-прежнему открывают свои сессии и транзакции, но поверх него,
+    а не берут каждый раз новое соединение из пула. Фоновые писатели (пачки сообщений,
+    отметки прочтения) работают через свой движок, поэтому событие, которое держит
+    соединение и ждёт записи своего сообщения, не отнимает у них пул.
+    """
+
+    def __init__(self, engine: 'AsyncEngine'):
+        self.busy = False
+        self._engine = engine
+        self._connection: 'AsyncConnection|None' = None
+        self._token: 'Token|None' = None
+
+    async def __aenter__(self) -> 'UnitOfWork':
+        self._token = _current.set(self)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        _current.reset(self._token)
+        if self._connection is not None:
+            await self._connection.close()
+
+    async def connection(self) -> 'AsyncConnection':
+        if self._connection is None:
+            self._connection = await self._engine.connect()
+        return self._connection
+
+
+class SessionScope:
+    """
+    Сессия метода адаптера.
+
+    Внутри `UnitOfWork` сессия привязывается к его соединению. Если соединение уже
+    занято (вложенный вызов или `gather` внутри события), берётся отдельное из пула.
+    """
+
+    def __init__(self, sc: 'async_sessionmaker[AsyncSession]'):
+        self._sc = sc
+        self._session: 'AsyncSession|None' = None
+        self._unit: 'UnitOfWork|None' = None
+
+    async def __aenter__(self) -> 'AsyncSession':
+        unit = _current.get()
+        if unit is None or unit.busy:
+            self._session = self._sc()
+        else:
+            unit.busy = True
+            self._unit = unit
+            self._session = self._sc(bind=await unit.connection())
+        return await self._session.__aenter__()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.__aexit__(*exc_info)
+        if self._unit is not None:
+            self._unit.busy = False
@@ -1,37 +1,85 @@
+from contextlib import nullcontext
 from typing import TYPE_CHECKING
 
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import (
-    AsyncSession, async_sessionmaker, create_async_engine,
-)
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from app.adapter.cache import LRUCache
 from app.adapter.hasher import generate_password_hash
+from app.adapter.store.batch import MessageWriteBatcher
 from app.adapter.store.chat import ChatAdapter
+from app.adapter.store.inbox import InboxAdapter
+from app.adapter.store.instrument import instrument_engine, instrument_methods
 from app.adapter.store.messages import MessageAdapter
 from app.adapter.store.models import User
+from app.adapter.store.presence import PresenceAdapter
+from app.adapter.store.receipts import ReceiptRecorder
+from app.adapter.store.session import (
+    WRITER_POOL_SIZE, SessionScope, UnitOfWork, create_engine,
+)
 from app.adapter.store.user import UserAdapter
-from app.settings import WS_DATA_BASE_DSN, WS_DATA_BASE_ECHO
+from app.metrics import cache_hits, cache_misses, cache_size
+from app.settings import (
+    WS_CHAT_MEMBERSHIP_CACHE_SIZE, WS_CHAT_MEMBERSHIP_CACHE_TTL,
+    WS_DATA_BASE_UNIT_OF_WORK, WS_MESSAGE_BATCH_SIZE,
+    WS_MESSAGE_BATCH_WINDOW_MS, WS_RECEIPT_FLUSH_INTERVAL_MS,
+)
 
 if TYPE_CHECKING:
+    from uuid import UUID
+
     from sqlalchemy.ext.asyncio import AsyncEngine
 
+    from app.adapter.dto.chat import ChatMembershipDto
+
 from app.logger import get_logger
 
 
-class DataBaseAdapter(UserAdapter, ChatAdapter, MessageAdapter):
+@instrument_methods
+class DataBaseAdapter(UserAdapter, ChatAdapter, MessageAdapter, InboxAdapter, PresenceAdapter):  # noqa: WPS215
 
     _logger = get_logger('DataBaseAdapter')
 
     _engine: 'AsyncEngine' = None
+    _writer_engine: 'AsyncEngine' = None
     _sc: 'async_sessionmaker[AsyncSession]' = None
+    _membership_cache: 'LRUCache[UUID, ChatMembershipDto]' = None
+    _message_batcher: 'MessageWriteBatcher' = None
+    _receipt_recorder: 'ReceiptRecorder' = None
 
     def __init__(self):
-        self._engine = create_async_engine(WS_DATA_BASE_DSN, echo=WS_DATA_BASE_ECHO, future=True)
+        self._engine = create_engine()
         self._sc = async_sessionmaker(self._engine, expire_on_commit=False)
+        instrument_engine(self._engine)
+        self._writer_engine = create_engine(pool_size=WRITER_POOL_SIZE, max_overflow=0)
+        writer_sc = async_sessionmaker(self._writer_engine, expire_on_commit=False)
+        instrument_engine(self._writer_engine)
+        self._membership_cache = LRUCache(WS_CHAT_MEMBERSHIP_CACHE_SIZE, WS_CHAT_MEMBERSHIP_CACHE_TTL)
+        cache_hits.add(('chat_membership',), lambda: self._membership_cache.hits)
+        cache_misses.add(('chat_membership',), lambda: self._membership_cache.misses)
+        cache_size.add(('chat_membership',), lambda: len(self._membership_cache))
+        self._message_batcher = MessageWriteBatcher(
+            writer_sc,
+            window=WS_MESSAGE_BATCH_WINDOW_MS / 1000,
+            max_size=WS_MESSAGE_BATCH_SIZE,
+        )
+        self._receipt_recorder = ReceiptRecorder(writer_sc, interval=WS_RECEIPT_FLUSH_INTERVAL_MS / 1000)
 
     def get_session(self) -> 'async_sessionmaker[AsyncSession]':
         return self._sc
 
+    def unit_of_work(self) -> 'UnitOfWork|nullcontext':
+        """Все методы адаптера внутри блока работают через одно соединение из пула."""
+        if not WS_DATA_BASE_UNIT_OF_WORK:
+            return nullcontext()
+        return UnitOfWork(self._engine)
+
+    async def close(self):
+        await self._message_batcher.stop()
+        await self._receipt_recorder.stop()
+        await self._writer_engine.dispose()
+        await self._engine.dispose()
+
     async def init_data(self):
         async with self._sc() as session:
             async with session.begin():
@@ -40,19 +88,26 @@ class DataBaseAdapter(UserAdapter, ChatAdapter, MessageAdapter):
                     users = [
                         User(
                             username='admin',
-                            password_hash=generate_password_hash('pass1'),
+                            password_hash=await generate_password_hash('pass1'),
                             email='mail1@mail.com',
                         ),
                         User(
                             username='guest',
-                            password_hash=generate_password_hash('pass2'),
+                            password_hash=await generate_password_hash('pass2'),
                             email='mail2@mail.com',
                         ),
                         User(
                             username='guest2',
-                            password_hash=generate_password_hash('pass3'),
+                            password_hash=await generate_password_hash('pass3'),
                             email='mail3@mail.com',
                         ),
                     ]
                     session.add_all(users)
                     await session.commit()
+
+    def forget_chat_membership(self, chat_id: 'UUID') -> None:
+        """Состав чата изменился в каком-то воркере: следующая проверка участия прочитает его из базы."""
+        self._membership_cache.invalidate(chat_id)
+
+    def _session(self) -> 'SessionScope':
+        return SessionScope(self._sc)
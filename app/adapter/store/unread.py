@@ -0,0 +1,86 @@
+from typing import TYPE_CHECKING
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from app.adapter.store.models import (
+    Message, chat_participants, chat_reads, chat_unread,
+)
+
+if TYPE_CHECKING:
+    from typing import Iterable, List, Tuple
+    from uuid import UUID
+
+# Upsert'ы счётчиков из пачки сообщений и из отметок прочтения идут в порядке первичного
+# ключа (user_id, chat_id), чтобы конкурирующие транзакции брали блокировки строк одинаково.
+# Строки chats при этом блокируют только проверки внешних ключей (KEY SHARE), а пачка
+# сообщений держит их FOR NO KEY UPDATE, с которым KEY SHARE не конфликтует.
+
+
+def increment_unread_stmt(message_ids: 'List[UUID]'):
+    """+1 каждому участнику чата, кроме отправителя, за каждое сообщение из пачки."""
+    recipients = chat_participants.c.user_id
+    added = (
+        select(Message.chat_id, recipients, func.count())
+        .join(chat_participants, chat_participants.c.chat_id == Message.chat_id)
+        .where(Message.id.in_(message_ids), recipients.is_distinct_from(Message.sender_id))
+    )
+    added = added.group_by(Message.chat_id, recipients).order_by(recipients, Message.chat_id)
+    stmt = insert(chat_unread).from_select(['chat_id', 'user_id', 'unread'], added)
+    return stmt.on_conflict_do_update(
+        index_elements=[chat_unread.c.user_id, chat_unread.c.chat_id],
+        set_={'unread': chat_unread.c.unread + stmt.excluded.unread},
+    )
+
+
+def create_unread_stmt(keys: 'List[Tuple[UUID, UUID]]'):
+    """Нулевые счётчики (chat_id, user_id), которых ещё нет, чтобы их строки можно было заблокировать."""
+    rows = [{'chat_id': chat_id, 'user_id': user_id, 'unread': 0} for chat_id, user_id in keys]
+    rows.sort(key=lambda row: (row['user_id'], row['chat_id']))
+    stmt = insert(chat_unread).values(rows)
+    return stmt.on_conflict_do_nothing(index_elements=[chat_unread.c.user_id, chat_unread.c.chat_id])
+
+
+def lock_unread_stmt(keys: 'List[Tuple[UUID, UUID]]'):
+    """
+    Блокирует счётчики (chat_id, user_id) перед пересчётом.
+
+    Блокировка ждёт пачки сообщений, которые уже прибавили к ним свои +1, а пересчёт
+    следующим запросом в READ COMMITTED видит их сообщения. Иначе он считал бы по
+    снимку до этих пачек и затирал их прибавку.
+    """
+    return (
+        select(chat_unread.c.user_id)
+        .where(tuple_(chat_unread.c.chat_id, chat_unread.c.user_id).in_(keys))
+        .order_by(chat_unread.c.user_id, chat_unread.c.chat_id)
+        .with_for_update()
+    )
+
+
+def refresh_unread_stmt(keys: 'Iterable[Tuple[UUID, UUID]]'):
+    """
+    Пересчёт счётчиков (chat_id, user_id) от их отметки прочтения.
+
+    Считаются только сообщения после отметки, по индексу (chat_id, created_at, id).
+    Строки счётчиков должны быть заблокированы `lock_unread_stmt` в той же транзакции.
+    """
+    unread = (
+        select(func.count())
+        .where(
+            Message.chat_id == chat_reads.c.chat_id,
+            Message.created_at > chat_reads.c.last_read_at,
+            Message.sender_id.is_distinct_from(chat_reads.c.user_id),
+        )
+        .correlate(chat_reads)
+        .scalar_subquery()
+    )
+    counted = (
+        select(chat_reads.c.chat_id, chat_reads.c.user_id, unread)
+        .where(tuple_(chat_reads.c.chat_id, chat_reads.c.user_id).in_(list(keys)))
+        .order_by(chat_reads.c.user_id, chat_reads.c.chat_id)
+    )
+    stmt = insert(chat_unread).from_select(['chat_id', 'user_id', 'unread'], counted)
+    return stmt.on_conflict_do_update(
+        index_elements=[chat_unread.c.user_id, chat_unread.c.chat_id],
+        set_={'unread': stmt.excluded.unread},
+    )
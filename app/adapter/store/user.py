@@ -26,10 +26,11 @@ class UserAdapter:
         email: 'str' = None,
     ) -> 'UserDto':
 
-        async with self._sc() as session:
+        password_hash = await generate_password_hash(password)
+        async with self._session() as session:
             user = User(
                 username=username,
-                password_hash=generate_password_hash(password),
+                password_hash=password_hash,
                 email=email,
             )
             session.add(user)
@@ -53,7 +54,7 @@ class UserAdapter:
         password: 'str',
     ) -> 'UserDto|None':
         self._logger.info('get_user_witch_check_password called with username=%s', username)
-        async with self._sc() as session:
+        async with self._session() as session:
             query = select(User).where(User.username == username)
             result = await session.execute(query)
 
@@ -63,18 +64,19 @@ class UserAdapter:
                 self._logger.info('get_user_witch_check_password no user with username=%s', username)
                 return None
 
-            if check_password_hash(password, user.password_hash):
-                return UserDto(
-                    id=user.id,
-                    username=user.username,
-                    email=user.email,
-                )
-            self._logger.info('get_user_witch_check_password incorrect password for username=%s', username)
-            return None
+        # пароль проверяется уже без сессии, чтобы не держать соединение на время хэширования
+        if await check_password_hash(password, user.password_hash):
+            return UserDto(
+                id=user.id,
+                username=user.username,
+                email=user.email,
+            )
+        self._logger.info('get_user_witch_check_password incorrect password for username=%s', username)
+        return None
 
     async def create_jwt(self: 'DataBaseAdapter', user: 'UserDto', token: 'str') -> 'TokenDto|None':
 
-        async with self._sc() as session:
+        async with self._session() as session:
             token = UserJwt(
                 token=token,
                 owner_id=user.user_id,
@@ -88,7 +90,7 @@ class UserAdapter:
 
     async def get_jwt(self: 'DataBaseAdapter', token: 'str') -> 'UserJwt|None':
 
-        async with self._sc() as session:
+        async with self._session() as session:
             query = select(UserJwt).where(UserJwt.token == token)
             result = await session.execute(query.options(selectinload(UserJwt.owner)))
             try:
@@ -106,7 +108,7 @@ class UserAdapter:
             )
 
     async def get_user_by_id(self: 'DataBaseAdapter', user_id: 'UUID') -> 'UserDto|None':
-        async with self._sc() as session:
+        async with self._session() as session:
             query = select(User).where(User.id == user_id)
             result = await session.execute(query)
             try:
@@ -120,9 +122,8 @@ class UserAdapter:
             )
 
     async def list_users(self: 'DataBaseAdapter', exclude_user_id: 'UUID') -> 'List[UserDto]':
-        async with self._sc() as session:
+        async with self._session() as session:
             result = await session.execute(
-                select(User).where(User.id != exclude_user_id)
+                select(User.id, User.email, User.username).where(User.id != exclude_user_id)
             )
-            users = result.scalars().all()
-            return [UserDto.model_validate(user) for user in users]
+            return [UserDto.model_validate(row) for row in result.all()]
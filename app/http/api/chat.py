@@ -1,15 +1,19 @@
 from typing import TYPE_CHECKING, List
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 
 from app.adapter import get_database_adapter
+from app.adapter.bus import get_fanout_bus
 from app.adapter.dto.chat import (
-    ChatCreateDto, ChatDto, ChatHistoryMessageResponse, UserDto,
+    ChatCreateDto, ChatDto, ChatHistoryMessageResponse,
+    ChatHistoryPageResponse, ChatSearchPageResponse, MessageCursor,
+    SearchCursor, UserDto,
 )
 from app.http.api.auth import auth_http
 
 if TYPE_CHECKING:
+    from app.adapter.dto.chat import ChatHistoryMessageDto, InboxCursor
     from app.adapter.store.sql_adapter import DataBaseAdapter
 
 chat_rout = APIRouter(prefix='/api/chat', tags=['chat'])
@@ -32,29 +36,83 @@ async def my_chats(
     return await adapter.get_my_chats(user_id=user.user_id)
 
 
-@chat_rout.get('/history/{chat_id}', response_model=List[ChatHistoryMessageResponse])
-async def chat_history(
+def parse_cursor(
+    cursor: 'str|None',
+    cursor_type: 'type[MessageCursor]|type[InboxCursor]' = MessageCursor,
+) -> 'MessageCursor|InboxCursor|None':
+    if cursor is None:
+        return None
+    try:
+        return cursor_type.decode(cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail='Invalid cursor') from exc
+
+
+def message_response(msg: 'ChatHistoryMessageDto') -> 'ChatHistoryMessageResponse':
+    return ChatHistoryMessageResponse.model_validate({
+        **msg.model_dump(),
+        'user': msg.sender,
+        'readers': msg.readers,
+    })
+
+
+@chat_rout.get('/history/{chat_id}', response_model=ChatHistoryPageResponse)
+async def chat_history(  # noqa: WPS211
     chat_id: 'UUID',
-    offset: int = 0,
-    limit: int = 5,
+    limit: int = Query(50, ge=1, le=200),
+    before: 'str|None' = None,
+    after: 'str|None' = None,
     adapter: 'DataBaseAdapter' = Depends(get_database_adapter),
     current_user: 'UserDto' = Depends(auth_http),
-) -> List[ChatHistoryMessageResponse]:
-    messages = await adapter.get_messages_by_chat_and_user_id(
+) -> ChatHistoryPageResponse:
+    page = await adapter.get_messages_by_chat_and_user_id(
         chat_id,
         current_user.user_id,
-        offset,
-        limit
+        limit,
+        before=parse_cursor(before),
+        after=parse_cursor(after),
     )
 
-    return [
-        ChatHistoryMessageResponse.model_validate({
-            **msg.model_dump(),
-            'user': msg.sender,
-            'readers': msg.readers
-        })
-        for msg in messages
-    ]
+    return ChatHistoryPageResponse(
+        messages=[message_response(msg) for msg in page.messages],
+        before=page.before.encode() if page.before else None,
+        after=page.after.encode() if page.after else None,
+    )
+
+
+@chat_rout.get('/search', response_model=ChatSearchPageResponse)
+async def search_messages(  # noqa: WPS211
+    q: str = Query(..., min_length=1, max_length=256),  # noqa: WPS111
+    chat_id: 'UUID|None' = None,
+    limit: int = Query(50, ge=1, le=200),
+    after: 'str|None' = None,
+    adapter: 'DataBaseAdapter' = Depends(get_database_adapter),
+    current_user: 'UserDto' = Depends(auth_http),
+) -> ChatSearchPageResponse:
+    """Полнотекстовый поиск по сообщениям чатов пользователя, `q` в синтаксисе websearch_to_tsquery."""
+    page = await adapter.search_messages(
+        current_user.user_id,
+        q,
+        chat_id=chat_id,
+        limit=limit,
+        after=parse_cursor(after, SearchCursor),
+    )
+    return ChatSearchPageResponse(
+        messages=[message_response(msg) for msg in page.messages],
+        after=page.after.encode() if page.after else None,
+    )
+
+
+@chat_rout.get('/online/{chat_id}', response_model=List[UUID])
+async def chat_online(
+    chat_id: 'UUID',
+    adapter: 'DataBaseAdapter' = Depends(get_database_adapter),
+    current_user: 'UserDto' = Depends(auth_http),
+) -> 'List[UUID]':
+    """Кто сейчас в чате, по всем воркерам."""
+    if await adapter.get_chat_membership(chat_id, current_user.user_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Chat not found')
+    return await adapter.online_users(chat_id)
 
 
 @chat_rout.delete('/leave/{chat_id}')
@@ -63,4 +121,8 @@ async def leave_chat(
     adapter: 'DataBaseAdapter' = Depends(get_database_adapter),
     current_user: 'UserDto' = Depends(auth_http),
 ) -> 'bool':
-    return await adapter.leave_chat(chat_id, current_user.user_id)
+    left = await adapter.leave_chat(chat_id, current_user.user_id)
+    if left:
+        # остальные воркеры держат состав чата в кэше: без сброса ушедший ещё получал бы и писал сообщения
+        await get_fanout_bus().invalidate_chat(chat_id)
+    return left
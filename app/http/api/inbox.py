@@ -0,0 +1,55 @@
+from typing import TYPE_CHECKING, Dict
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Query
+
+from app.adapter import get_database_adapter
+from app.adapter.dto.chat import (
+    InboxChatResponse, InboxCursor, InboxPageResponse, UserDto,
+)
+from app.http.api.auth import auth_http
+from app.http.api.chat import message_response, parse_cursor
+
+if TYPE_CHECKING:
+    from app.adapter.dto.chat import InboxChatDto
+    from app.adapter.store.sql_adapter import DataBaseAdapter
+
+inbox_rout = APIRouter(prefix='/api/chat', tags=['chat'])
+
+
+def _inbox_response(chat: 'InboxChatDto') -> 'InboxChatResponse':
+    last_message = chat.last_message
+    return InboxChatResponse(
+        id=chat.chat_id,
+        chat_name=chat.chat_name,
+        chat_type=chat.chat_type,
+        owner_id=chat.owner_id,
+        participants=chat.participants,
+        last_message=message_response(last_message) if last_message else None,
+        unread=chat.unread,
+        activity_at=chat.activity_at,
+    )
+
+
+@inbox_rout.get('/inbox', response_model=InboxPageResponse)
+async def inbox(
+    limit: int = Query(50, ge=1, le=200),
+    after: 'str|None' = None,
+    adapter: 'DataBaseAdapter' = Depends(get_database_adapter),
+    current_user: 'UserDto' = Depends(auth_http),
+) -> InboxPageResponse:
+    """Чаты пользователя с последним сообщением и непрочитанными, от недавней активности к давней."""
+    page = await adapter.get_inbox(current_user.user_id, limit, after=parse_cursor(after, InboxCursor))
+    return InboxPageResponse(
+        chats=[_inbox_response(chat) for chat in page.chats],
+        after=page.after.encode() if page.after else None,
+    )
+
+
+@inbox_rout.get('/unread', response_model=Dict[UUID, int])
+async def unread_counts(
+    adapter: 'DataBaseAdapter' = Depends(get_database_adapter),
+    current_user: 'UserDto' = Depends(auth_http),
+) -> 'Dict[UUID, int]':
+    """Непрочитанные по всем чатам пользователя, чаты без непрочитанных не возвращаются."""
+    return await adapter.get_unread_counts(current_user.user_id)
@@ -0,0 +1,44 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.adapter.recent import recent_messages
+from app.http.api.websocket import active_connections
+from app.http.jwt import token_cache
+from app.http.ws.connection import send_queue_stats
+from app.http.ws.heartbeat import heartbeat
+from app.http.ws.replay import replay
+from app.metrics import (
+    cache_hits, cache_misses, cache_size, heartbeat_events, render,
+    send_queue_depth, send_queue_events, ws_connections,
+)
+
+metrics_rout = APIRouter(tags=['metrics'])
+
+
+def _open_connections() -> 'int':
+    return sum(len(connections) for connections in active_connections.values())
+
+
+ws_connections.add((), _open_connections)
+send_queue_depth.add((), lambda: send_queue_stats.depth)
+send_queue_events.add_attributes(send_queue_stats, ('enqueued', 'sent', 'frames', 'dropped', 'evicted'))
+
+heartbeat_events.add(('ping',), lambda: heartbeat.stats.pings)
+heartbeat_events.add(('reaped',), lambda: heartbeat.stats.reaped)
+
+cache_hits.add(('auth',), lambda: token_cache.hits)
+cache_misses.add(('auth',), lambda: token_cache.misses)
+cache_size.add(('auth',), lambda: len(token_cache))
+
+cache_hits.add(('replay',), lambda: replay.hits)
+cache_misses.add(('replay',), lambda: replay.misses)
+cache_size.add(('replay',), lambda: len(replay))
+
+cache_hits.add(('history',), lambda: recent_messages.hits)
+cache_misses.add(('history',), lambda: recent_messages.misses)
+cache_size.add(('history',), lambda: len(recent_messages))
+
+
+@metrics_rout.get('/metrics', response_class=PlainTextResponse)
+async def metrics() -> 'PlainTextResponse':
+    return PlainTextResponse(render(), media_type='text/plain; version=0.0.4')
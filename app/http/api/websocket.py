@@ -1,124 +1,311 @@
 from asyncio import gather
-from typing import Dict
+from contextlib import nullcontext
+from functools import partial
+from time import monotonic
+from typing import TYPE_CHECKING, Iterable
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, WebSocket
-from pydantic import ValidationError as PydanticValidationError
-from starlette.websockets import WebSocketState
+from fastapi import APIRouter, Depends, WebSocket, WebSocketException
+from starlette import status
 
 from app.adapter import DataBaseAdapter, get_database_adapter
-from app.adapter.dto.chat import ChatMessageCreateDto
+from app.adapter.bus import get_fanout_bus
+from app.adapter.dto.chat import ChatHistoryMessageDto, ChatMessageCreateDto
 from app.adapter.dto.user import UserDto
-from app.adapter.dto.ws import WebSocketEvent, WebSocketEventType
+from app.adapter.dto.ws import (
+    ChatPresenceEvent, MessageEvent, ResumeEvent, UpdateReadersEvent,
+    WebSocketEvent, WebSocketEventType,
+)
+from app.adapter.recent import recent_messages
 from app.http.api.auth import auth_ws
+from app.http.ws.coalesce import FrameBatch
+from app.http.ws.codec import EncodedFrames, negotiate
+from app.http.ws.connection import Connection, OverflowPolicy
+from app.http.ws.heartbeat import heartbeat
+from app.http.ws.pipeline import EventPipeline
+from app.http.ws.presence import presence
+from app.http.ws.replay import event_meta, remember_event, replay
 from app.logger import get_logger
+from app.metrics import (
+    fanout_recipients, fanout_seconds, ws_event_seconds, ws_events,
+)
+from app.settings import (
+    WS_FRAME_BATCH_MAX_BYTES, WS_FRAME_BATCH_MAX_EVENTS,
+    WS_FRAME_BATCH_WINDOW_MS, WS_INBOUND_CONCURRENCY, WS_REPLAY_LIMIT,
+    WS_SEND_QUEUE_POLICY, WS_SEND_QUEUE_SIZE,
+)
+
+if TYPE_CHECKING:
+    from app.adapter.dto.ws import InboundEvent
 
 _logger = get_logger('Websocket')
 
 ws_rout = APIRouter(prefix='/ws')
 
-active_connections: 'Dict[UUID, list[WebSocket]]' = {}
+active_connections: 'dict[UUID, list[Connection]]' = {}
 
-online_users: 'Dict[UUID, list[UUID]]' = {}
+frame_batch = FrameBatch(WS_FRAME_BATCH_WINDOW_MS / 1000, WS_FRAME_BATCH_MAX_EVENTS, WS_FRAME_BATCH_MAX_BYTES)
 
 
-async def connect_user(user: 'UserDto', websocket: 'WebSocket'):
-    await websocket.accept()
-    active_connections.setdefault(user.user_id, []).append(websocket)
+async def connect_user(user: 'UserDto', websocket: 'WebSocket', batch: bool = False) -> 'Connection':
+    codec, subprotocol = negotiate(websocket.scope.get('subprotocols', []))
+    await websocket.accept(subprotocol=subprotocol)
+    connection = Connection(
+        websocket,
+        user,
+        codec,
+        WS_SEND_QUEUE_SIZE,
+        OverflowPolicy(WS_SEND_QUEUE_POLICY),
+        frame_batch if batch else None,
+    )
+    connection.start()
+    heartbeat.add(connection)
+    active_connections.setdefault(user.user_id, []).append(connection)
     _logger.info('Added connection for %s,  %s:%d', user.user_id, websocket.client.host, websocket.client.port)
+    return connection
+
+
+async def disconnect_user(connection: 'Connection', adapter: DataBaseAdapter):
+    user_connections = active_connections.get(connection.user.user_id, [])
+    if connection in user_connections:
+        user_connections.remove(connection)
+    heartbeat.remove(connection)
+    websocket = connection.ws
+    _logger.info(
+        'Remove connection for %s,  %s:%d', connection.user.user_id, websocket.client.host, websocket.client.port,
+    )
+    await connection.close()
+    await gather(*[
+        broadcast_presence_lost(connection, chat_id, adapter)
+        for chat_id in presence.disconnect(connection)
+    ])
 
 
-async def disconnect_user(user: 'UserDto', websocket: 'WebSocket'):
-    active_connections[user.user_id].remove(websocket)
-    _logger.info('Remove connection for %s,  %s:%d', user.user_id, websocket.client.host, websocket.client.port)
-    if websocket.client_state == WebSocketState.CONNECTED:
-        await websocket.close()
+async def broadcast_presence_lost(connection: 'Connection', chat_id: UUID, adapter: DataBaseAdapter):
+    # присутствие снимается и у того, кто уже вышел из участников чата
+    if await adapter.exit_presence(presence.worker_id, chat_id, connection.user.user_id):
+        await broadcast_user_exit(connection.user, chat_id, adapter)
 
 
-async def broadcast_to_user(wse: WebSocketEvent, user_id: UUID):
-    exclude = {
-        'ws': True,
-        'user': {'email'},
-    }
-    payload = wse.model_dump_json(exclude=exclude)
-    coroutines = [conn.send_text(payload) for conn in active_connections.get(user_id, [])]
-    await gather(*coroutines)
+async def broadcast_presence_expired(chat_id: UUID, user_id: UUID, adapter: DataBaseAdapter):
+    """Пользователь пропал из чата вместе с упавшим воркером, который держал его сокеты."""
+    user = await adapter.get_user_by_id(user_id)
+    if user is not None:
+        await broadcast_user_exit(user, chat_id, adapter)
 
 
-async def broadcast_new_message(wse: WebSocketEvent, adapter: DataBaseAdapter):
-    _logger.info('Broadcast new message for %s', wse)
-    chat = await adapter.get_chat_by_id_and_user_id(wse.chat_id, wse.user.user_id)
+async def broadcast_user_exit(user: 'UserDto', chat_id: UUID, adapter: DataBaseAdapter):
+    chat = await adapter.get_chat_membership(chat_id, user.user_id)
     if chat is None:
-        _logger.warning(f'No chat for {wse.chat_id}')
         return
-    saved_message = await adapter.save_message(
-        ChatMessageCreateDto(
-            sender_id=wse.user.user_id,
-            chat_id=wse.chat_id,
-            text=wse.message,
-        ),
+    wse = WebSocketEvent(
+        type=WebSocketEventType.USER_EXIT_CHAT,
+        user=user,
+        chat_id=chat_id,
     )
-    wse.message_id = saved_message.message_id
-    wse.user_id = saved_message.sender_id
-    wse.created_at = saved_message.created_at
-    wse.updated_at = saved_message.updated_at
+    await broadcast_to_users(wse, chat.participant_ids)
+
+
+async def deliver_to_users(user_ids: 'Iterable[UUID]', payload: str, meta: str = ''):
+    remember_event(meta, payload)
+    frames = EncodedFrames(payload)
+    for user_id in user_ids:
+        for connection in active_connections.get(user_id, []):
+            connection.enqueue(frames.encode(connection.codec))
+
 
-    coroutines = [broadcast_to_user(wse, user.user_id) for user in chat.participants]
-    await gather(*coroutines)
+def encode_event(wse: WebSocketEvent) -> str:
+    return wse.model_dump_json(exclude={'user': {'email'}})
 
 
-async def broadcast_update_readers(wse: WebSocketEvent, adapter: DataBaseAdapter):
-    _logger.info('Broadcast update readers for %s', wse)
-    chat = await adapter.get_chat_by_id_and_user_id(wse.chat_id, wse.user.user_id)
+async def broadcast_to_users(wse: WebSocketEvent, user_ids: 'Iterable[UUID]'):
+    with fanout_seconds.time():
+        user_ids = list(user_ids)
+        await get_fanout_bus().publish(user_ids, encode_event(wse), event_meta(wse))
+    fanout_recipients.inc(amount=len(user_ids))
 
+
+async def broadcast_new_message(event: 'MessageEvent', connection: 'Connection', adapter: DataBaseAdapter):
+    chat = await adapter.get_chat_membership(event.chat_id, connection.user.user_id)
     if chat is None:
-        _logger.warning(f'No chat for {wse.chat_id}')
+        _logger.warning('No chat for %s', event.chat_id)
         return
-
-    msg = await adapter.add_reader(wse.chat_id, wse.message_id, wse.user.user_id)
-    wse.readers = msg.readers
-    coroutines = [broadcast_to_user(wse, user.user_id) for user in chat.participants]
-    await gather(*coroutines)
+    saved_message = await adapter.save_message(
+        ChatMessageCreateDto(
+            sender_id=connection.user.user_id,
+            chat_id=event.chat_id,
+            text=event.message,
+        ),
+    )
+    recent_messages.put(event.chat_id, [
+        ChatHistoryMessageDto(
+            id=saved_message.message_id,
+            chat_id=event.chat_id,
+            text=event.message,
+            sender=connection.user,
+            seq=saved_message.seq,
+            created_at=saved_message.created_at,
+            updated_at=saved_message.updated_at,
+        ),
+    ])
+    wse = WebSocketEvent(
+        type=event.type,
+        user=connection.user,
+        chat_id=event.chat_id,
+        message=event.message,
+        message_id=saved_message.message_id,
+        user_id=saved_message.sender_id,
+        seq=saved_message.seq,
+        created_at=saved_message.created_at,
+        updated_at=saved_message.updated_at,
+    )
+    await broadcast_to_users(wse, chat.participant_ids)
 
 
-async def broadcast_user_enter(wse: WebSocketEvent, adapter: DataBaseAdapter):
-    _logger.info('Broadcast user enter for %s', wse)
-    chat = await adapter.get_chat_by_id_and_user_id(wse.chat_id, wse.user.user_id)
+async def broadcast_update_readers(event: 'UpdateReadersEvent', connection: 'Connection', adapter: DataBaseAdapter):
+    chat = await adapter.get_chat_membership(event.chat_id, connection.user.user_id)
     if chat is None:
-        _logger.warning(f'No chat for {wse.chat_id}')
+        _logger.warning('No chat for %s', event.chat_id)
         return
-    online_users.setdefault(chat.chat_id, []).append(wse.user.user_id)
-    coroutines = [broadcast_to_user(wse, user.user_id) for user in chat.participants]
-    await gather(*coroutines)
+
+    msg = await adapter.add_reader(event.chat_id, event.message_id, connection.user.user_id)
+    wse = WebSocketEvent(
+        type=event.type,
+        user=connection.user,
+        chat_id=event.chat_id,
+        message_id=event.message_id,
+        readers=msg.readers,
+    )
+    await broadcast_to_users(wse, chat.participant_ids)
 
 
-async def broadcast_user_exit(wse: WebSocketEvent, adapter: DataBaseAdapter):
-    _logger.info('Broadcast user exit for %s', wse)
-    chat = await adapter.get_chat_by_id_and_user_id(wse.chat_id, wse.user.user_id)
+async def track_presence(
+    event_type: WebSocketEventType, connection: 'Connection', chat_id: UUID, adapter: DataBaseAdapter,
+) -> bool:
+    """Меняет присутствие пользователя в чате и возвращает, изменилось ли оно во всех воркерах."""
+    user_id = connection.user.user_id
+    if event_type == WebSocketEventType.USER_ENTER_CHAT:
+        if not presence.enter(connection, chat_id):
+            return False
+        return await adapter.enter_presence(presence.worker_id, chat_id, user_id)
+    if not presence.exit(connection, chat_id):
+        return False
+    return await adapter.exit_presence(presence.worker_id, chat_id, user_id)
+
+
+async def broadcast_presence(event: 'ChatPresenceEvent', connection: 'Connection', adapter: DataBaseAdapter):
+    chat = await adapter.get_chat_membership(event.chat_id, connection.user.user_id)
     if chat is None:
-        _logger.warning(f'No chat for {wse.chat_id}')
+        _logger.warning('No chat for %s', event.chat_id)
         return
+    if await track_presence(event.type, connection, chat.chat_id, adapter):
+        wse = WebSocketEvent(type=event.type, user=connection.user, chat_id=event.chat_id)
+        await broadcast_to_users(wse, chat.participant_ids)
+
+
+def message_event(msg: 'ChatHistoryMessageDto') -> 'WebSocketEvent':
+    return WebSocketEvent(
+        type=WebSocketEventType.MESSAGE,
+        user=msg.sender,
+        chat_id=msg.chat_id,
+        message=msg.text,
+        message_id=msg.message_id,
+        user_id=msg.sender.user_id,
+        seq=msg.seq,
+        created_at=msg.created_at,
+        updated_at=msg.updated_at,
+    )
+
+
+def replay_limit(connection: 'Connection') -> int:
+    """Сколько сообщений одного чата докачивать за раз: половина очереди остаётся под живые события."""
+    return max(1, min(WS_REPLAY_LIMIT, connection.max_size // 2))
+
+
+async def missed_events(chat_id: UUID, after: int, limit: int, adapter: DataBaseAdapter) -> 'list[str]':
+    """
+    Пропущенные сообщения чата из кольца воркера, а если оно их уже вытеснило - из базы.
+
+    Возвращает до `limit + 1` сообщений, лишнее значит, что докачка обрезана.
+    """
+    payloads = replay.since(chat_id, after)
+    if payloads is not None:
+        return payloads[:limit + 1]
+    messages = await adapter.get_messages_since(chat_id, after, limit + 1)
+    return [encode_event(message_event(msg)) for msg in messages]
+
 
-    users = online_users.get(chat.chat_id, [])
-    users.remove(wse.user.user_id)
-    online_users[chat.chat_id] = users
-    coroutines = [broadcast_to_user(wse, user.user_id) for user in chat.participants]
-    await gather(*coroutines)
+async def replay_chat(connection: 'Connection', chat_id: UUID, after: int, adapter: DataBaseAdapter):
+    limit = replay_limit(connection)
+    payloads = await missed_events(chat_id, after, limit, adapter)
+    for payload in payloads[:limit]:
+        connection.enqueue(connection.codec.transcode(payload))
+    if len(payloads) > limit:
+        # номера в чате идут без пропусков, клиент продолжит докачку с next_seq
+        wse = WebSocketEvent(
+            type=WebSocketEventType.RESUME,
+            user=connection.user,
+            chat_id=chat_id,
+            next_seq=after + limit + 1,
+        )
+        connection.enqueue(connection.codec.transcode(encode_event(wse)))
 
 
-async def handle_ws_event(wse: WebSocketEvent, adapter: DataBaseAdapter):
-    match wse.type:
-        case WebSocketEventType.PING | WebSocketEventType.PONG:
-            _logger.info(f'Received {wse.type} from {wse.host_port}: ')
-        case WebSocketEventType.MESSAGE:
-            await broadcast_new_message(wse, adapter)
-        case WebSocketEventType.UPDATE_READERS:
-            await broadcast_update_readers(wse, adapter)
-        case WebSocketEventType.USER_ENTER_CHAT:
-            await broadcast_user_enter(wse, adapter)
-        case WebSocketEventType.USER_EXIT_CHAT:
-            await broadcast_user_exit(wse, adapter)
-        case _: _logger.warning(f'Not handled {wse.type}')
+async def resume_session(event: 'ResumeEvent', connection: 'Connection', adapter: DataBaseAdapter):
+    user_id = connection.user.user_id
+    room = min(2 * replay_limit(connection), connection.max_size)
+    # чаты по одному и только когда писатель освободил очередь: докачка не вытесняет сама себя
+    # и после массового переподключения не занимает весь пул
+    for chat_id, after in event.cursors.items():
+        if await adapter.get_chat_membership(chat_id, user_id) is None:  # noqa: WPS476
+            continue
+        if not await connection.wait_room(room):  # noqa: WPS476
+            return
+        await replay_chat(connection, chat_id, after, adapter)  # noqa: WPS476
+
+
+async def handle_ws_event(event: 'InboundEvent', connection: 'Connection', adapter: DataBaseAdapter):
+    labels = (event.type.value,)
+    ws_events.inc(labels)
+    with ws_event_seconds.time(labels):
+        await dispatch_ws_event(event, connection, adapter)
+
+
+async def dispatch_ws_event(event: 'InboundEvent', connection: 'Connection', adapter: DataBaseAdapter):
+    _logger.debug('Received %s from %s', event.type.value, connection.user.user_id)
+    match event:
+        case MessageEvent():
+            await broadcast_new_message(event, connection, adapter)
+        case UpdateReadersEvent():
+            await broadcast_update_readers(event, connection, adapter)
+        case ChatPresenceEvent():
+            await broadcast_presence(event, connection, adapter)
+        case ResumeEvent():
+            await resume_session(event, connection, adapter)
+
+
+async def handle_connection_event(connection: 'Connection', adapter: DataBaseAdapter, event: 'InboundEvent'):
+    # докачка ждёт места в очереди сокета, держать на это время соединение из пула нельзя
+    unit = nullcontext() if isinstance(event, ResumeEvent) else adapter.unit_of_work()
+    try:
+        async with unit:
+            await handle_ws_event(event, connection, adapter)
+    except WebSocketException as exc:
+        _logger.warning('Close connection for %s: %s', connection.user.user_id, exc.reason)
+        await connection.close(code=exc.code, reason=exc.reason)
+
+
+async def receive_events(connection: 'Connection', pipeline: EventPipeline):
+    async for frame in connection.codec.frames(connection.ws):
+        connection.last_seen = monotonic()
+        try:
+            event = connection.codec.parse(frame)
+        except ValueError as exc:
+            # ValidationError схемы события или битый кадр msgpack
+            _logger.warning('Invalid event from %s: %s', connection.user.user_id, type(exc).__name__)
+            await connection.close(code=status.WS_1003_UNSUPPORTED_DATA, reason='Invalid event')
+            return
+        await pipeline.submit(event)
 
 
 @ws_rout.websocket('/subscribe')
@@ -126,17 +313,12 @@ async def websocket_endpoint(
         ws: WebSocket,
         user: UserDto = Depends(auth_ws),
         adapter: DataBaseAdapter = Depends(get_database_adapter),
+        batch: bool = False,
 ):
-    await connect_user(user, ws)
-    async for msg in ws.iter_json():
-        _logger.info(f'Message from {user.user_id} {user.username}: {msg}')
-        msg.update({'ws': ws, 'user': user})
-        event = None
-        try:
-            event = WebSocketEvent.model_validate(msg)
-        except PydanticValidationError as pve:
-            _logger.error(f'Invalid WebSocket message: {pve}')
-            await disconnect_user(user, ws)
-        if event is not None:
-            await handle_ws_event(event, adapter)
-    await disconnect_user(user, ws)
+    connection = await connect_user(user, ws, batch)
+    pipeline = EventPipeline(partial(handle_connection_event, connection, adapter), WS_INBOUND_CONCURRENCY)
+    try:
+        await receive_events(connection, pipeline)
+    finally:
+        await pipeline.drain()
+        await disconnect_user(connection, adapter)
@@ -1,28 +1,47 @@
 from contextlib import asynccontextmanager
+from functools import partial
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
 from app.adapter import get_database_sync_adapter
+from app.adapter.bus import get_fanout_bus
 from app.http.api.auth import auth_rout
 from app.http.api.chat import chat_rout
+from app.http.api.inbox import inbox_rout
+from app.http.api.metrics import metrics_rout
 from app.http.api.user import users_rout
-from app.http.api.websocket import ws_rout
+from app.http.api.websocket import (
+    broadcast_presence_expired, deliver_to_users, ws_rout,
+)
+from app.http.middleware import UnitOfWorkMiddleware
+from app.http.ws.heartbeat import heartbeat
+from app.http.ws.presence import presence_sweeper
 from app.settings import WS_SELF_STATIC
 
 
 @asynccontextmanager
-async def lifespan(app: FastAPI):
+async def lifespan(app: FastAPI):  # noqa: WPS217
     adapter = get_database_sync_adapter()
     await adapter.init_data()
+    bus = get_fanout_bus()
+    await bus.start(deliver_to_users, adapter.forget_chat_membership)
+    heartbeat.start()
+    await presence_sweeper.start(adapter, partial(broadcast_presence_expired, adapter=adapter))
     yield
+    await presence_sweeper.stop(adapter)
+    await heartbeat.stop()
+    await bus.stop()
+    await adapter.close()
 
 
 app = FastAPI(title='WS Chat Zero Two', lifespan=lifespan)
 
 app.include_router(ws_rout)
 
+app.add_middleware(UnitOfWorkMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=['*'],
@@ -33,6 +52,8 @@ app.add_middleware(
 app.include_router(auth_rout)
 app.include_router(users_rout)
 app.include_router(chat_rout)
+app.include_router(inbox_rout)
+app.include_router(metrics_rout)
 
 if WS_SELF_STATIC:
     app.mount('/', StaticFiles(directory='dist', html=True), name='frontend')
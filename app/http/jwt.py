@@ -1,4 +1,5 @@
 import datetime
+import time
 import uuid
 from typing import TYPE_CHECKING
 
@@ -6,16 +7,35 @@ from fastapi import HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 
+from app.adapter.cache import LRUCache
 from app.settings import (
-    WS_ACCESS_TOKEN_EXPIRE_MINUTES, WS_ALGORITHM, WS_SECRET_KEY,
+    WS_ACCESS_TOKEN_EXPIRE_MINUTES, WS_ALGORITHM, WS_AUTH_CACHE_SIZE,
+    WS_AUTH_CACHE_TTL, WS_SECRET_KEY,
 )
 
 if TYPE_CHECKING:
+    from typing import Tuple
+
     from app.adapter.dto.user import UserDto
     from app.adapter.store.sql_adapter import DataBaseAdapter
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='auth/login')
 
+# токен -> (exp токена, пользователь), чтобы не ходить в базу на каждый запрос;
+# сбросить токен раньше нельзя, запись живёт до WS_AUTH_CACHE_TTL или exp токена
+token_cache: 'LRUCache[str, Tuple[float, UserDto]]' = LRUCache(WS_AUTH_CACHE_SIZE, WS_AUTH_CACHE_TTL)
+
+
+def _cached_user(token: 'str') -> 'UserDto|None':
+    cached = token_cache.get(token)
+    if cached is None:
+        return None
+    expire, user = cached
+    if expire > time.time():
+        return user
+    token_cache.invalidate(token)
+    return None
+
 
 async def create_access_token(user: 'UserDto', adapter: 'DataBaseAdapter') -> 'str':
     payload = {
@@ -32,6 +52,10 @@ async def create_access_token(user: 'UserDto', adapter: 'DataBaseAdapter') -> 's
 
 
 async def get_current_user(token: 'str', adapter: 'DataBaseAdapter',) -> 'UserDto':
+    cached = _cached_user(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(status_code=401, detail='Could not validate credentials')
     try:
         payload = jwt.decode(token, WS_SECRET_KEY, algorithms=[WS_ALGORITHM])
@@ -45,4 +69,5 @@ async def get_current_user(token: 'str', adapter: 'DataBaseAdapter',) -> 'UserDt
     result = await adapter.get_user_by_id(uuid.UUID(user_id))
     if not result:
         raise credentials_exception
+    token_cache.set(token, (payload.get('exp', 0), result))
     return result
@@ -0,0 +1,24 @@
+from typing import TYPE_CHECKING
+
+from app.adapter import get_database_sync_adapter
+
+if TYPE_CHECKING:
+    from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+# вход и регистрация почти всё время ждут хэширования пароля, соединение им нужно на один запрос
+SKIP_PREFIXES = ('/auth/',)
+
+
+class UnitOfWorkMiddleware:
+    """HTTP запрос целиком работает с базой через одно соединение из пула."""
+
+    def __init__(self, app: 'ASGIApp'):
+        self.app = app
+
+    async def __call__(self, scope: 'Scope', receive: 'Receive', send: 'Send') -> None:
+        if scope['type'] != 'http' or scope['path'].startswith(SKIP_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        async with get_database_sync_adapter().unit_of_work():
+            await self.app(scope, receive, send)
@@ -0,0 +1,38 @@
+import asyncio
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Deque, Tuple
+
+    from app.http.ws.codec import JsonCodec
+
+
+class FrameBatch:
+    """
+    Склейка исходящих событий сокета в один кадр-массив.
+
+    Писатель, получив первое событие, ждёт `window` секунд и отправляет одним
+    кадром всё накопившееся, но не больше `max_events` событий и примерно
+    `max_bytes` байт. Событие больше `max_bytes` уходит отдельным кадром-массивом.
+    """
+
+    def __init__(self, window: 'float', max_events: 'int', max_bytes: 'int'):
+        self.window = window
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+
+    async def wait(self, queue: 'Deque[str|bytes]') -> None:
+        if len(queue) < self.max_events:
+            await asyncio.sleep(self.window)
+
+    def take(self, queue: 'Deque[str|bytes]', codec: 'JsonCodec') -> 'Tuple[str|bytes|None, int]':
+        frames = []
+        size = 0
+        while queue and len(frames) < self.max_events:
+            size += len(queue[0])
+            if frames and size > self.max_bytes:
+                break
+            frames.append(queue.popleft())
+        if not frames:
+            return None, 0
+        return codec.join(frames), len(frames)
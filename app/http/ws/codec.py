@@ -0,0 +1,140 @@
+import json
+import struct
+from typing import TYPE_CHECKING
+from uuid import UUID
+
+from app.adapter.dto.ws import inbound_event_adapter
+
+try:
+    import msgpack
+except ModuleNotFoundError:
+    msgpack = None
+
+if TYPE_CHECKING:
+    from typing import Any, AsyncIterator, Dict, Iterable, List, Tuple
+
+    from fastapi import WebSocket
+
+    from app.adapter.dto.ws import InboundEvent
+
+# поля событий, которые в msgpack передаются сырыми 16 байтами
+UUID_KEYS = frozenset(('chat_id', 'message_id', 'user_id'))
+
+
+class JsonCodec:
+    """Формат по умолчанию: JSON в текстовых кадрах."""
+
+    subprotocol = 'wsc.json'
+
+    def frames(self, ws: 'WebSocket') -> 'AsyncIterator[str|bytes]':
+        return ws.iter_text()
+
+    async def send(self, ws: 'WebSocket', frame: 'str|bytes') -> None:
+        await ws.send_text(frame)
+
+    def decode(self, frame: 'str|bytes') -> 'Dict[str, Any]':
+        return json.loads(frame)
+
+    def parse(self, frame: 'str|bytes') -> 'InboundEvent':
+        """Входящее событие, ValueError - если кадр не разбирается или событие не проходит проверку."""
+        return inbound_event_adapter.validate_json(frame)
+
+    def transcode(self, payload: 'str') -> 'str|bytes':
+        return payload
+
+    def join(self, frames: 'List[str|bytes]') -> 'str|bytes':
+        return '[{0}]'.format(','.join(frames))
+
+
+class MsgpackCodec(JsonCodec):
+    """MessagePack в бинарных кадрах, UUID - 16 байт, даты - целые секунды."""
+
+    subprotocol = 'wsc.msgpack'
+
+    def frames(self, ws: 'WebSocket') -> 'AsyncIterator[str|bytes]':
+        return ws.iter_bytes()
+
+    async def send(self, ws: 'WebSocket', frame: 'str|bytes') -> None:
+        await ws.send_bytes(frame)
+
+    def decode(self, frame: 'str|bytes') -> 'Dict[str, Any]':
+        try:
+            return _unpack_uuids(msgpack.unpackb(frame))
+        except msgpack.UnpackException as exc:
+            # почти все ошибки распаковки уже ValueError, остальные приводятся к нему же
+            raise ValueError(str(exc)) from exc
+
+    def parse(self, frame: 'str|bytes') -> 'InboundEvent':
+        return inbound_event_adapter.validate_python(self.decode(frame))
+
+    def transcode(self, payload: 'str') -> 'str|bytes':
+        return msgpack.packb(_pack_uuids(json.loads(payload)))
+
+    def join(self, frames: 'List[str|bytes]') -> 'str|bytes':
+        return _array_header(len(frames)) + b''.join(frames)
+
+
+JSON_CODEC = JsonCodec()
+
+# msgpack - необязательная зависимость, без неё клиентам доступен только JSON
+CODECS = (JSON_CODEC,) if msgpack is None else (JSON_CODEC, MsgpackCodec())
+
+
+def negotiate(requested: 'Iterable[str]') -> 'Tuple[JsonCodec, str|None]':
+    """Первый поддерживаемый из предложенных клиентом подпротоколов, иначе JSON без подпротокола."""
+    for subprotocol in requested:
+        for codec in CODECS:
+            if codec.subprotocol == subprotocol:
+                return codec, subprotocol
+    return JSON_CODEC, None
+
+
+class EncodedFrames:
+    """Кадры одного события, каждый формат кодируется не больше одного раза."""
+
+    def __init__(self, payload: 'str'):
+        self._payload = payload
+        self._frames: 'Dict[str, str|bytes]' = {}
+
+    def encode(self, codec: 'JsonCodec') -> 'str|bytes':
+        frame = self._frames.get(codec.subprotocol)
+        if frame is None:
+            frame = codec.transcode(self._payload)
+            self._frames[codec.subprotocol] = frame
+        return frame
+
+
+def _array_header(size: 'int') -> 'bytes':
+    if size < 16:
+        return struct.pack('B', 0x90 | size)
+    if size < 0x10000:
+        return struct.pack('>BH', 0xdc, size)
+    return struct.pack('>BI', 0xdd, size)
+
+
+def _pack_uuids(value: 'Any') -> 'Any':
+    if isinstance(value, dict):
+        return {key: _pack_field(key, item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_pack_uuids(item) for item in value]
+    return value
+
+
+def _pack_field(key: 'str', item: 'Any') -> 'Any':
+    if key in UUID_KEYS and isinstance(item, str):
+        return bytes.fromhex(item.replace('-', ''))
+    return _pack_uuids(item)
+
+
+def _unpack_uuids(value: 'Any') -> 'Any':
+    if isinstance(value, dict):
+        return {key: _unpack_field(key, item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_unpack_uuids(item) for item in value]
+    return value
+
+
+def _unpack_field(key: 'str', item: 'Any') -> 'Any':
+    if key in UUID_KEYS and isinstance(item, bytes):
+        return UUID(bytes=item)
+    return _unpack_uuids(item)
@@ -0,0 +1,153 @@
+import asyncio
+from collections import deque
+from enum import Enum
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from starlette import status
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+from app.logger import get_logger
+
+if TYPE_CHECKING:
+    from typing import Deque, Tuple
+
+    from fastapi import WebSocket
+
+    from app.adapter.dto.user import UserDto
+    from app.http.ws.coalesce import FrameBatch
+    from app.http.ws.codec import JsonCodec
+
+_logger = get_logger('Connection')
+
+
+class OverflowPolicy(Enum):
+    DROP_OLDEST = 'drop_oldest'
+    DISCONNECT = 'disconnect'
+
+
+class SendQueueStats:
+    def __init__(self):
+        self.depth = 0
+        self.enqueued = 0
+        self.sent = 0
+        self.frames = 0
+        self.dropped = 0
+        self.evicted = 0
+
+
+send_queue_stats = SendQueueStats()
+
+
+class Connection:
+    """
+    Сокет пользователя с собственной очередью отправки.
+
+    Рассылка только кладёт payload в очередь и не ждёт клиента, отправкой
+    занимается отдельная задача. Переполнение очереди медленным клиентом
+    обрабатывается согласно `OverflowPolicy`. С `FrameBatch` события, накопившиеся
+    за окно, уходят одним кадром-массивом.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        ws: 'WebSocket',
+        user: 'UserDto',
+        codec: 'JsonCodec',
+        max_size: 'int',
+        policy: 'OverflowPolicy',
+        batch: 'FrameBatch|None' = None,
+    ):
+        self.ws = ws
+        self.user = user
+        self.codec = codec
+        self.closed = False
+        self.last_seen = monotonic()
+        self.max_size = max_size
+        self._policy = policy
+        self._batch = batch
+        self._queue: 'Deque[str|bytes]' = deque()
+        self._ready = asyncio.Event()
+        self._room = asyncio.Event()
+        self._writer: 'asyncio.Task|None' = None
+        self._closing: 'asyncio.Task|None' = None
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, payload: 'str|bytes') -> bool:
+        if self.closed:
+            return False
+
+        if len(self._queue) >= self.max_size:
+            if self._policy == OverflowPolicy.DISCONNECT:
+                send_queue_stats.evicted += 1
+                _logger.warning('Send queue overflow for %s %s, disconnect', self.user.user_id, self.ws.client)
+                self._stop()
+                self._closing = asyncio.create_task(
+                    self.close(code=status.WS_1008_POLICY_VIOLATION, reason='Slow consumer'),
+                )
+                return False
+            self._queue.popleft()
+            send_queue_stats.dropped += 1
+            send_queue_stats.depth -= 1
+
+        self._queue.append(payload)
+        self._ready.set()
+        send_queue_stats.enqueued += 1
+        send_queue_stats.depth += 1
+        return True
+
+    async def wait_room(self, size: 'int') -> bool:
+        """Ждёт, пока в очереди освободится `size` мест. False, если соединение закрылось раньше."""
+        while not self.closed and self.max_size - len(self._queue) < size:
+            self._room.clear()
+            await self._room.wait()
+        return not self.closed
+
+    async def close(self, code: 'int' = status.WS_1000_NORMAL_CLOSURE, reason: 'str|None' = None) -> None:
+        self._stop()
+        if self._writer is not None:
+            await asyncio.gather(self._writer, return_exceptions=True)
+        if self.ws.application_state == WebSocketState.CONNECTED:
+            await self.ws.close(code=code, reason=reason)
+
+    def _stop(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        send_queue_stats.depth -= len(self._queue)
+        self._queue.clear()
+        self._room.set()
+        if self._writer is not None:
+            self._writer.cancel()
+
+    async def _write_loop(self) -> None:
+        while not self.closed:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            payload, count = await _next_frame(self._queue, self.codec, self._batch)
+            if payload is None:
+                continue
+            send_queue_stats.depth -= count
+            try:
+                await self.codec.send(self.ws, payload)
+            except (WebSocketDisconnect, RuntimeError, OSError) as exc:
+                _logger.info('Send to %s %s failed: %r', self.user.user_id, self.ws.client, exc)
+                self._stop()
+                return
+            send_queue_stats.sent += count
+            send_queue_stats.frames += 1
+            self._room.set()
+
+
+async def _next_frame(
+    queue: 'Deque[str|bytes]', codec: 'JsonCodec', batch: 'FrameBatch|None',
+) -> 'Tuple[str|bytes|None, int]':
+    if batch is None:
+        return queue.popleft(), 1
+    await batch.wait(queue)
+    return batch.take(queue, codec)
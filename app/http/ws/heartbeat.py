@@ -0,0 +1,95 @@
+import asyncio
+import json
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from starlette import status
+
+from app.adapter.dto.ws import WebSocketEventType
+from app.logger import get_logger
+from app.settings import WS_HEARTBEAT_INTERVAL, WS_IDLE_TIMEOUT
+
+if TYPE_CHECKING:
+    from typing import Dict, List, Set
+
+    from app.http.ws.connection import Connection
+
+_logger = get_logger('Heartbeat')
+
+WHEEL_SLOTS = 64
+
+PING_FRAME = json.dumps({'type': WebSocketEventType.PING.value})
+
+
+class HeartbeatStats:
+    def __init__(self):
+        self.pings = 0
+        self.reaped = 0
+
+
+class HeartbeatWheel:
+    """
+    Timing wheel для heartbeat всех сокетов процесса.
+
+    Сокеты раскладываются по `WHEEL_SLOTS` слотам, единственная задача раз в
+    `interval / WHEEL_SLOTS` секунд проверяет один слот, так что каждый сокет
+    проверяется раз в `interval`. Молчавшему дольше `interval` отправляется PING,
+    молчавший дольше `timeout` закрывается.
+    """
+
+    def __init__(self, interval: 'float', timeout: 'float'):
+        self.interval = interval
+        self.timeout = timeout
+        self.stats = HeartbeatStats()
+        self._slots: 'List[Set[Connection]]' = [set() for _ in range(WHEEL_SLOTS)]
+        self._positions: 'Dict[Connection, int]' = {}
+        self._cursor = 0
+        self._worker: 'asyncio.Task|None' = None
+        self._closing: 'Set[asyncio.Task]' = set()
+
+    def add(self, connection: 'Connection') -> None:
+        position = (self._cursor - 1) % WHEEL_SLOTS
+        self._slots[position].add(connection)
+        self._positions[connection] = position
+
+    def remove(self, connection: 'Connection') -> None:
+        position = self._positions.pop(connection, None)
+        if position is not None:
+            self._slots[position].discard(connection)
+
+    def start(self) -> None:
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+
+    async def _run(self) -> None:
+        tick = self.interval / WHEEL_SLOTS
+        while True:
+            await asyncio.sleep(tick)
+            self._advance(monotonic())
+
+    def _advance(self, now: 'float') -> None:
+        slot = self._slots[self._cursor]
+        self._cursor = (self._cursor + 1) % WHEEL_SLOTS
+        for connection in list(slot):
+            idle = now - connection.last_seen
+            if idle >= self.timeout:
+                self.remove(connection)
+                self.stats.reaped += 1
+                _reap(connection, self._closing)
+            elif idle >= self.interval:
+                connection.enqueue(connection.codec.transcode(PING_FRAME))
+                self.stats.pings += 1
+
+
+def _reap(connection: 'Connection', closing: 'Set[asyncio.Task]') -> None:
+    _logger.info('Reap idle connection for %s %s', connection.user.user_id, connection.ws.client)
+    task = asyncio.create_task(connection.close(code=status.WS_1001_GOING_AWAY, reason='Idle timeout'))
+    closing.add(task)
+    task.add_done_callback(closing.discard)
+
+
+heartbeat = HeartbeatWheel(WS_HEARTBEAT_INTERVAL, WS_IDLE_TIMEOUT)
@@ -0,0 +1,69 @@
+import asyncio
+from typing import TYPE_CHECKING
+
+from app.adapter.dto.ws import WebSocketEventType
+from app.logger import get_logger
+
+if TYPE_CHECKING:
+    from typing import Awaitable, Callable, Dict, Hashable, Set
+
+    from app.adapter.dto.ws import InboundEvent
+
+_logger = get_logger('EventPipeline')
+
+
+def _lane_key(event: 'InboundEvent') -> 'Hashable|None':
+    match event.type:
+        case WebSocketEventType.MESSAGE:
+            return event.type, event.chat_id
+        case WebSocketEventType.USER_ENTER_CHAT | WebSocketEventType.USER_EXIT_CHAT:
+            return WebSocketEventType.USER_ENTER_CHAT, event.chat_id
+        case _:
+            return None
+
+
+class EventPipeline:
+    """
+    Конвейер входящих событий одного сокета.
+
+    Одновременно обрабатывается не больше `concurrency` событий. Сообщения
+    одного чата, как и вход/выход из одного чата, обрабатываются строго по порядку,
+    остальные события (например, прочтения в разных чатах) выполняются параллельно.
+    """
+
+    def __init__(self, handler: 'Callable[[InboundEvent], Awaitable[None]]', concurrency: 'int'):
+        self._handler = handler
+        self._slots = asyncio.Semaphore(concurrency)
+        self._lanes: 'Dict[Hashable, asyncio.Task]' = {}
+        self._tasks: 'Set[asyncio.Task]' = set()
+
+    async def submit(self, event: 'InboundEvent') -> None:
+        await self._slots.acquire()
+        lane = _lane_key(event)
+        previous = self._lanes.get(lane)
+        task = asyncio.create_task(self._run(event, previous))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if lane is not None:
+            self._lanes[lane] = task
+            task.add_done_callback(lambda done: self._release_lane(lane, done))
+
+    async def drain(self) -> None:
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, event: 'InboundEvent', previous: 'asyncio.Task|None') -> None:
+        try:
+            await self._handle_after(event, previous)
+        except Exception as exc:  # noqa: B902
+            _logger.exception('Failed to handle %s: %r', event.type, exc)
+        finally:
+            self._slots.release()
+
+    async def _handle_after(self, event: 'InboundEvent', previous: 'asyncio.Task|None') -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        await self._handler(event)
+
+    def _release_lane(self, lane: 'Hashable', task: 'asyncio.Task') -> None:
+        if self._lanes.get(lane) is task:
+            self._lanes.pop(lane)
@@ -0,0 +1,108 @@
+import asyncio
+from typing import TYPE_CHECKING
+from uuid import uuid4
+
+from app.logger import get_logger
+from app.settings import WS_PRESENCE_TTL
+
+if TYPE_CHECKING:
+    from typing import Awaitable, Callable, Dict, List, Set
+    from uuid import UUID
+
+    from app.adapter.store.sql_adapter import DataBaseAdapter
+    from app.http.ws.connection import Connection
+
+    Expired = Callable[[UUID, UUID], Awaitable[None]]
+
+_logger = get_logger('Presence')
+
+
+class PresenceRegistry:
+    """
+    Кто сейчас находится в каком чате.
+
+    Пользователь считается онлайн в чате, пока в нём есть хотя бы одно его устройство (сокет),
+    поэтому на пару (чат, пользователь) хранится счётчик сокетов. `enter`/`exit`/`disconnect`
+    возвращают, изменилось ли присутствие пользователя в этом воркере; общее для всех воркеров
+    присутствие хранится в базе под `worker_id` (см. `PresenceAdapter`).
+    """
+
+    def __init__(self):
+        self.worker_id = uuid4()
+        self._online: 'Dict[UUID, Dict[UUID, int]]' = {}
+        self._entered: 'Dict[Connection, Set[UUID]]' = {}
+
+    def enter(self, connection: 'Connection', chat_id: 'UUID') -> bool:
+        chats = self._entered.setdefault(connection, set())
+        if chat_id in chats:
+            return False
+        chats.add(chat_id)
+
+        users = self._online.setdefault(chat_id, {})
+        user_id = connection.user.user_id
+        users[user_id] = users.get(user_id, 0) + 1
+        return users[user_id] == 1
+
+    def exit(self, connection: 'Connection', chat_id: 'UUID') -> bool:
+        chats = self._entered.get(connection)
+        if chats is None or chat_id not in chats:
+            return False
+        chats.discard(chat_id)
+        if not chats:
+            self._entered.pop(connection)
+        return self._release(chat_id, connection.user.user_id)
+
+    def disconnect(self, connection: 'Connection') -> 'List[UUID]':
+        chats = self._entered.pop(connection, set())
+        return [chat_id for chat_id in chats if self._release(chat_id, connection.user.user_id)]
+
+    def _release(self, chat_id: 'UUID', user_id: 'UUID') -> bool:
+        users = self._online[chat_id]
+        users[user_id] -= 1
+        if users[user_id] > 0:
+            return False
+        users.pop(user_id)
+        if not users:
+            self._online.pop(chat_id)
+        return True
+
+
+class PresenceSweeper:
+    """
+    Продлевает присутствие воркера в базе раз в треть `ttl`.
+
+    Присутствие воркеров, которые не продлевали его дольше `ttl` (упали, не закрыв сокеты),
+    снимается, и для пользователей, пропавших так из чата, вызывается `on_expired`.
+    """
+
+    def __init__(self, registry: 'PresenceRegistry', ttl: 'float'):
+        self.registry = registry
+        self.ttl = ttl
+        self._worker: 'asyncio.Task|None' = None
+
+    async def start(self, adapter: 'DataBaseAdapter', on_expired: 'Expired') -> None:
+        await self._sweep(adapter, on_expired)
+        self._worker = asyncio.create_task(self._run(adapter, on_expired))
+
+    async def stop(self, adapter: 'DataBaseAdapter') -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        await adapter.drop_presence(self.registry.worker_id)
+
+    async def _run(self, adapter: 'DataBaseAdapter', on_expired: 'Expired') -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self._sweep(adapter, on_expired)
+            except Exception:  # noqa: B902
+                _logger.exception('Presence refresh failed')
+
+    async def _sweep(self, adapter: 'DataBaseAdapter', on_expired: 'Expired') -> None:
+        expired = await adapter.refresh_presence(self.registry.worker_id, self.ttl)
+        await asyncio.gather(*[on_expired(*pair) for pair in expired])
+
+
+presence = PresenceRegistry()
+
+presence_sweeper = PresenceSweeper(presence, WS_PRESENCE_TTL)
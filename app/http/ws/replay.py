@@ -0,0 +1,122 @@
+import json
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING
+from uuid import UUID
+
+from app.adapter.dto.user import UserDto
+from app.adapter.dto.ws import WebSocketEventType
+from app.adapter.recent import recent_messages
+from app.settings import WS_REPLAY_CHATS, WS_REPLAY_SIZE
+
+if TYPE_CHECKING:
+    from typing import Deque, List, Tuple
+
+    from app.adapter.dto.ws import WebSocketEvent
+
+    Ring = Deque[Tuple[int, str]]
+
+
+class ReplayBuffer:
+    """
+    Последние сообщения каждого чата для докачки после переподключения.
+
+    Кормится на стороне доставки: каждый воркер получает из шины все события,
+    поэтому кольцо чата одинаково полно в любом воркере, куда вернулся клиент.
+    События без `seq` (присутствие, отметки) не хранятся. Повторы одного `seq` отбрасываются.
+    """
+
+    def __init__(self, size: 'int', max_chats: 'int'):
+        self._size = size
+        self._max_chats = max_chats
+        self._chats: 'OrderedDict[str, Ring]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> 'int':
+        return len(self._chats)
+
+    def add(self, chat_id: 'str', seq: 'int', payload: 'str') -> None:
+        ring = self._ring(chat_id)
+        if not ring or seq > ring[-1][0]:
+            ring.append((seq, payload))
+            return
+        if seq < ring[0][0]:
+            return
+
+        # публикации разных воркеров могут прийти не в порядке номеров
+        position = len(ring)
+        while ring[position - 1][0] > seq:
+            position -= 1
+        if ring[position - 1][0] == seq:
+            return
+        if len(ring) == self._size:
+            ring.popleft()
+            position -= 1
+        ring.insert(position, (seq, payload))
+
+    def since(self, chat_id: 'UUID', after: 'int') -> 'List[str]|None':
+        """Сообщения с номерами после `after` подряд, или None, если кольцо их уже не покрывает."""
+        ring = self._chats.get(str(chat_id))
+        if not ring or ring[0][0] > after + 1:
+            self.misses += 1
+            return None
+
+        payloads = []
+        for seq, payload in ring:
+            if seq <= after:
+                continue
+            if seq != after + len(payloads) + 1:
+                self.misses += 1
+                return None
+            payloads.append(payload)
+        self.hits += 1
+        return payloads
+
+    def _ring(self, chat_id: 'str') -> 'Ring':
+        ring = self._chats.get(chat_id)
+        if ring is not None:
+            self._chats.move_to_end(chat_id)
+            return ring
+
+        ring = deque(maxlen=self._size)
+        self._chats[chat_id] = ring
+        if len(self._chats) > self._max_chats:
+            self._chats.popitem(last=False)
+        return ring
+
+
+replay = ReplayBuffer(WS_REPLAY_SIZE, WS_REPLAY_CHATS)
+
+
+def event_meta(wse: 'WebSocketEvent') -> 'str':
+    """Сводка события для `remember_event`: воркерам не нужно разбирать payload, чтобы его запомнить."""
+    if wse.seq is not None:
+        return json.dumps([wse.chat_id.hex, wse.seq])
+    if wse.type == WebSocketEventType.UPDATE_READERS:
+        readers = [[reader.user_id.hex, reader.email, reader.username] for reader in wse.readers]
+        return json.dumps([wse.chat_id.hex, wse.message_id.hex, readers])
+    return ''
+
+
+def remember_event(meta: 'str', payload: 'str') -> None:
+    """Кольцо докачки и кэш истории воркера узнают о событии из шины, от какого бы воркера оно ни пришло."""
+    if not meta:
+        return
+    chat_hex, *fields = json.loads(meta)
+    chat_id = UUID(hex=chat_hex)
+    if len(fields) == 1:
+        _remember_message(chat_id, fields[0], payload)
+    else:
+        _remember_readers(chat_id, *fields)
+
+
+def _remember_message(chat_id: 'UUID', seq: 'int', payload: 'str') -> None:
+    replay.add(str(chat_id), seq, payload)
+    recent_messages.seen(chat_id, seq)
+
+
+def _remember_readers(chat_id: 'UUID', message_hex: 'str', readers: 'List[List[str]]') -> None:
+    recent_messages.read(chat_id, UUID(hex=message_hex), [
+        UserDto(id=UUID(hex=user_hex), email=email, username=username)
+        for user_hex, email, username in readers
+    ])
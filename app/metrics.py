@@ -0,0 +1,174 @@
+from bisect import bisect_left
+from functools import partial
+from itertools import accumulate
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Callable, Dict, Iterator, List, Tuple
+
+    Labels = Tuple[str, ...]
+
+# секунды, от быстрых операций в памяти до медленных запросов
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5,
+)
+
+
+class Metric:
+    """
+    Метрика в текстовом формате Prometheus.
+
+    Без внешних зависимостей: запись в горячем пути - это обращение к словарю
+    по кортежу меток, всё форматирование делается только при запросе `/metrics`.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: 'str', documentation: 'str', labels: 'Labels' = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        registry.append(self)
+
+    def samples(self) -> 'Iterator[Tuple[str, Labels, Labels, float]]':
+        raise NotImplementedError
+
+    def render(self) -> 'List[str]':
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.documentation),
+            '# TYPE {0} {1}'.format(self.name, self.kind),
+        ]
+        samples = self.samples()
+        lines.extend(_format_sample(self.name, *sample) for sample in samples)
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: 'str', documentation: 'str', labels: 'Labels' = ()):
+        super().__init__(name, documentation, labels)
+        self._values: 'Dict[Labels, float]' = {}
+
+    def inc(self, label_values: 'Labels' = (), amount: 'float' = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> 'Iterator[Tuple[str, Labels, Labels, float]]':
+        for label_values, sample in self._values.items():
+            yield '', self.labels, label_values, sample
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self, name: 'str', documentation: 'str', labels: 'Labels' = (), buckets: 'Tuple[float, ...]' = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        self._counts: 'Dict[Labels, List[int]]' = {}
+        self._sums: 'Dict[Labels, float]' = {}
+
+    def observe(self, amount: 'float', label_values: 'Labels' = ()) -> None:
+        counts = self._counts.get(label_values)
+        if counts is None:
+            counts = [0 for _ in range(len(self.buckets) + 1)]
+            self._counts[label_values] = counts
+        counts[bisect_left(self.buckets, amount)] += 1
+        self._sums[label_values] = self._sums.get(label_values, 0) + amount
+
+    def time(self, label_values: 'Labels' = ()) -> 'Timer':
+        return Timer(self, label_values)
+
+    def samples(self) -> 'Iterator[Tuple[str, Labels, Labels, float]]':
+        bucket_labels = (*self.labels, 'le')
+        for label_values, counts in self._counts.items():
+            for bound, total in zip((*self.buckets, '+Inf'), accumulate(counts)):
+                yield '_bucket', bucket_labels, (*label_values, str(bound)), total
+            yield '_sum', self.labels, label_values, self._sums[label_values]
+            yield '_count', self.labels, label_values, sum(counts)
+
+
+class Timer:
+    def __init__(self, histogram: 'Histogram', label_values: 'Labels'):
+        self._histogram = histogram
+        self._label_values = label_values
+        self._started = 0
+
+    def __enter__(self) -> 'Timer':
+        self._started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(perf_counter() - self._started, self._label_values)
+
+
+class CallbackMetric(Metric):
+    """Значение, которое считается при запросе `/metrics` из уже существующих счётчиков."""
+
+    def __init__(self, name: 'str', documentation: 'str', kind: 'str', labels: 'Labels' = ()):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self._callbacks: 'Dict[Labels, Callable[[], float]]' = {}
+
+    def add(self, label_values: 'Labels', callback: 'Callable[[], float]') -> None:
+        self._callbacks[label_values] = callback
+
+    def add_attributes(self, source: 'object', names: 'Tuple[str, ...]') -> None:
+        """Каждый атрибут `source` - отдельное значение с именем атрибута в метке."""
+        for name in names:
+            self._callbacks[(name,)] = partial(getattr, source, name)
+
+    def samples(self) -> 'Iterator[Tuple[str, Labels, Labels, float]]':
+        for label_values, callback in self._callbacks.items():
+            yield '', self.labels, label_values, callback()
+
+
+registry: 'List[Metric]' = []
+
+
+def render() -> 'str':
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def _format_sample(name: 'str', suffix: 'str', names: 'Labels', label_values: 'Labels', sample: 'float') -> 'str':
+    return '{0}{1}{2} {3}'.format(name, suffix, _format_labels(names, label_values), sample)
+
+
+def _format_labels(names: 'Labels', label_values: 'Labels') -> 'str':
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{0}="{1}"'.format(name, _escape(label_value))
+        for name, label_value in zip(names, label_values)
+    )
+    return '{{{0}}}'.format(pairs)
+
+
+def _escape(label_value: 'str') -> 'str':
+    return label_value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+ws_connections = CallbackMetric('wsc_ws_connections', 'Open WebSocket connections', 'gauge')
+ws_events = Counter('wsc_ws_events_total', 'Inbound WebSocket events', ('type',))
+ws_event_seconds = Histogram('wsc_ws_event_seconds', 'Inbound WebSocket event handling time', ('type',))
+fanout_seconds = Histogram('wsc_fanout_seconds', 'Time to encode and publish one event to its recipients')
+fanout_recipients = Counter('wsc_fanout_recipients_total', 'Users addressed by published events')
+send_queue_depth = CallbackMetric('wsc_send_queue_depth', 'Events waiting in send queues across connections', 'gauge')
+send_queue_events = CallbackMetric(
+    'wsc_send_queue_events_total', 'Send queue events across connections', 'counter', ('stat',),
+)
+heartbeat_events = CallbackMetric(
+    'wsc_heartbeat_total', 'Heartbeat pings and reaped connections', 'counter', ('event',),
+)
+cache_hits = CallbackMetric('wsc_cache_hits_total', 'Cache hits', 'counter', ('cache',))
+cache_misses = CallbackMetric('wsc_cache_misses_total', 'Cache misses', 'counter', ('cache',))
+cache_size = CallbackMetric('wsc_cache_size', 'Cache entries', 'gauge', ('cache',))
+db_method_seconds = Histogram('wsc_db_method_seconds', 'DataBaseAdapter method time', ('method',))
+db_query_seconds = Histogram('wsc_db_query_seconds', 'SQL statement time by DataBaseAdapter method', ('method',))
@@ -10,6 +10,21 @@ WS_DATA_BASE_DSN: 'str' = getenv('WS_DATA_BASE_DSN', None)
 
 WS_DATA_BASE_ECHO: 'bool' = getenv('WS_DATA_BASE_ECHO', 'on') == 'on'
 
+WS_DATA_BASE_POOL_SIZE = int(getenv('WS_DATA_BASE_POOL_SIZE', 5))
+
+WS_DATA_BASE_MAX_OVERFLOW = int(getenv('WS_DATA_BASE_MAX_OVERFLOW', 10))
+
+WS_DATA_BASE_POOL_PRE_PING: 'bool' = getenv('WS_DATA_BASE_POOL_PRE_PING', 'off') == 'on'
+
+# -1 - не пересоздавать соединения по возрасту
+WS_DATA_BASE_POOL_RECYCLE = int(getenv('WS_DATA_BASE_POOL_RECYCLE', -1))
+
+# 0 - выключить кэш prepared statements asyncpg (нужно за pgbouncer в transaction режиме)
+WS_DATA_BASE_STATEMENT_CACHE_SIZE = int(getenv('WS_DATA_BASE_STATEMENT_CACHE_SIZE', 100))
+
+# одно соединение из пула на всё WebSocket событие или HTTP запрос
+WS_DATA_BASE_UNIT_OF_WORK: 'bool' = getenv('WS_DATA_BASE_UNIT_OF_WORK', 'on') == 'on'
+
 WS_SECRET_KEY: 'str' = getenv('WS_SECRET_KEY', None)
 
 WS_ALGORITHM = getenv('WS_ALGORITHM', 'HS256')
@@ -19,3 +34,63 @@ WS_ACCESS_TOKEN_EXPIRE_MINUTES = int(getenv('WS_ACCESS_TOKEN_EXPIRE_MINUTES', 60
 WS_LOG_LEVEL = getenv('WS_LOG_LEVEL', 'INFO')
 
 WS_SELF_STATIC = getenv('WS_SELF_STATIC', 'off') == 'on'
+
+WS_FANOUT_BACKEND = getenv('WS_FANOUT_BACKEND', 'local')
+
+WS_FANOUT_CHANNEL = getenv('WS_FANOUT_CHANNEL', 'ws_fanout')
+
+WS_CHAT_MEMBERSHIP_CACHE_SIZE = int(getenv('WS_CHAT_MEMBERSHIP_CACHE_SIZE', 10000))
+
+# между воркерами кэш не синхронизируется, TTL ограничивает время жизни устаревшего состава чата
+WS_CHAT_MEMBERSHIP_CACHE_TTL = float(getenv('WS_CHAT_MEMBERSHIP_CACHE_TTL', 60))
+
+WS_SEND_QUEUE_SIZE = int(getenv('WS_SEND_QUEUE_SIZE', 256))
+
+# drop_oldest - выкидывать старые события, disconnect - отключать медленного клиента
+WS_SEND_QUEUE_POLICY = getenv('WS_SEND_QUEUE_POLICY', 'drop_oldest')
+
+WS_INBOUND_CONCURRENCY = int(getenv('WS_INBOUND_CONCURRENCY', 8))
+
+WS_MESSAGE_BATCH_WINDOW_MS = float(getenv('WS_MESSAGE_BATCH_WINDOW_MS', 5))
+
+WS_MESSAGE_BATCH_SIZE = int(getenv('WS_MESSAGE_BATCH_SIZE', 100))
+
+WS_RECEIPT_FLUSH_INTERVAL_MS = float(getenv('WS_RECEIPT_FLUSH_INTERVAL_MS', 500))
+
+WS_AUTH_CACHE_SIZE = int(getenv('WS_AUTH_CACHE_SIZE', 10000))
+
+WS_AUTH_CACHE_TTL = float(getenv('WS_AUTH_CACHE_TTL', 300))
+
+WS_HASH_WORKERS = int(getenv('WS_HASH_WORKERS', 4))
+
+WS_HEARTBEAT_INTERVAL = float(getenv('WS_HEARTBEAT_INTERVAL', 30))
+
+WS_IDLE_TIMEOUT = float(getenv('WS_IDLE_TIMEOUT', 90))
+
+# через сколько секунд без продления снимается присутствие в чатах упавшего воркера
+WS_PRESENCE_TTL = float(getenv('WS_PRESENCE_TTL', 30))
+
+WS_HOST = getenv('WS_HOST', '127.0.0.1')
+
+WS_PORT = int(getenv('WS_PORT', 8000))
+
+WS_PER_MESSAGE_DEFLATE: 'bool' = getenv('WS_PER_MESSAGE_DEFLATE', 'on') == 'on'
+
+WS_FRAME_BATCH_WINDOW_MS = float(getenv('WS_FRAME_BATCH_WINDOW_MS', 10))
+
+WS_FRAME_BATCH_MAX_EVENTS = int(getenv('WS_FRAME_BATCH_MAX_EVENTS', 50))
+
+WS_FRAME_BATCH_MAX_BYTES = int(getenv('WS_FRAME_BATCH_MAX_BYTES', 64 * 1024))
+
+WS_REPLAY_SIZE = int(getenv('WS_REPLAY_SIZE', 256))
+
+WS_REPLAY_CHATS = int(getenv('WS_REPLAY_CHATS', 10000))
+
+WS_REPLAY_LIMIT = int(getenv('WS_REPLAY_LIMIT', 100))
+
+WS_HISTORY_CACHE_SIZE = int(getenv('WS_HISTORY_CACHE_SIZE', 100))
+
+WS_HISTORY_CACHE_CHATS = int(getenv('WS_HISTORY_CACHE_CHATS', 1000))
+
+# отметки прочтения от чтения истории не рассылаются, TTL ограничивает их устаревание в кэше истории
+WS_HISTORY_CACHE_TTL = float(getenv('WS_HISTORY_CACHE_TTL', 30))
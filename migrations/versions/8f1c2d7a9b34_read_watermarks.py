@@ -0,0 +1,57 @@
+"""read watermarks
+
+Revision ID: 8f1c2d7a9b34
+Revises: 53593b91642e
+Create Date: 2026-10-18 10:12:41.318406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f1c2d7a9b34'
+down_revision: Union[str, None] = '53593b91642e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('chat_reads',
+    sa.Column('chat_id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('last_read_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('chat_id', 'user_id')
+    )
+    op.execute("""
+        INSERT INTO chat_reads (chat_id, user_id, last_read_at)
+        SELECT m.chat_id, r.user_id, max(m.created_at)
+        FROM messages_read r
+        JOIN messages m ON m.id = r.message_id
+        WHERE m.chat_id IS NOT NULL AND m.created_at IS NOT NULL
+        GROUP BY m.chat_id, r.user_id
+    """)
+    op.drop_table('messages_read')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table('messages_read',
+    sa.Column('message_id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('message_id', 'user_id')
+    )
+    op.execute("""
+        INSERT INTO messages_read (message_id, user_id)
+        SELECT m.id, r.user_id
+        FROM chat_reads r
+        JOIN messages m ON m.chat_id = r.chat_id AND m.created_at <= r.last_read_at
+    """)
+    op.drop_table('chat_reads')
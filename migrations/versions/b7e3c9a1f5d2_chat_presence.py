@@ -0,0 +1,42 @@
+"""chat presence
+
+Revision ID: b7e3c9a1f5d2
+Revises: a2d8f6c4e1b9
+Create Date: 2026-10-18 19:48:03.215764
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c9a1f5d2'
+down_revision: Union[str, None] = 'a2d8f6c4e1b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('presence_workers',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('seen_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('chat_presence',
+    sa.Column('chat_id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('worker_id', sa.UUID(), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['worker_id'], ['presence_workers.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('chat_id', 'user_id', 'worker_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('chat_presence')
+    op.drop_table('presence_workers')
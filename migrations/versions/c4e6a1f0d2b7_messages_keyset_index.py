@@ -0,0 +1,28 @@
+"""messages keyset index
+
+Revision ID: c4e6a1f0d2b7
+Revises: 8f1c2d7a9b34
+Create Date: 2026-10-18 11:02:17.527733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e6a1f0d2b7'
+down_revision: Union[str, None] = '8f1c2d7a9b34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_messages_chat_id_created_at_id', 'messages', ['chat_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_chat_id_created_at_id', table_name='messages')
@@ -0,0 +1,45 @@
+"""chat unread
+
+Revision ID: e3a9c5d8b6f2
+Revises: d7b2e9f4a1c3
+Create Date: 2026-10-18 18:05:43.118027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a9c5d8b6f2'
+down_revision: Union[str, None] = 'd7b2e9f4a1c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('chat_unread',
+    sa.Column('chat_id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('unread', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'chat_id')
+    )
+    op.execute("""
+        INSERT INTO chat_unread (chat_id, user_id, unread)
+        SELECT p.chat_id, p.user_id, count(m.id)
+        FROM chat_participants p
+        LEFT JOIN chat_reads r ON r.chat_id = p.chat_id AND r.user_id = p.user_id
+        JOIN messages m ON m.chat_id = p.chat_id
+            AND m.sender_id IS DISTINCT FROM p.user_id
+            AND (r.last_read_at IS NULL OR m.created_at > r.last_read_at)
+        GROUP BY p.chat_id, p.user_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('chat_unread')
@@ -0,0 +1,46 @@
+"""message seq
+
+Revision ID: f4c1b8e2d9a7
+Revises: e3a9c5d8b6f2
+Create Date: 2026-10-18 18:41:09.370514
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c1b8e2d9a7'
+down_revision: Union[str, None] = 'e3a9c5d8b6f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chats', sa.Column('last_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('messages', sa.Column('seq', sa.BigInteger(), nullable=True))
+    op.execute("""
+        UPDATE messages m SET seq = numbered.seq
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY chat_id ORDER BY created_at, id) AS seq
+            FROM messages
+        ) numbered
+        WHERE m.id = numbered.id
+    """)
+    op.execute("""
+        UPDATE chats c SET last_seq = counted.last_seq
+        FROM (SELECT chat_id, max(seq) AS last_seq FROM messages GROUP BY chat_id) counted
+        WHERE c.id = counted.chat_id
+    """)
+    op.alter_column('messages', 'seq', nullable=False)
+    op.create_index('ix_messages_chat_id_seq', 'messages', ['chat_id', 'seq'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_chat_id_seq', table_name='messages')
+    op.drop_column('messages', 'seq')
+    op.drop_column('chats', 'last_seq')
@@ -36,8 +36,9 @@ export class Api {
         return axios.post("/auth/register", val);
     }
 
-    static getHistory(chat_id: string, limit=50, offset=0) {
-        return axios.get(`/api/chat/history/${chat_id}?limit=${limit}&offset=${offset}`);
+    static getHistory(chat_id: string, limit=50, before: string | null = null) {
+        const cursor = before ? `&before=${encodeURIComponent(before)}` : "";
+        return axios.get(`/api/chat/history/${chat_id}?limit=${limit}${cursor}`);
     }
 
     static leaveChat(chat_id: string) {
@@ -14,11 +14,14 @@ export type Message = {
   updated_at: string;
   type?: string
   id: string;
+  seq?: number;
 }
 
 export interface MessageState {
   messages: { [id: string]: Message[] };
   unreadMessageIds: { [id: string]: Set<string> };
+  lastSeq: { [id: string]: number };
+  aheadSeq: { [id: string]: number[] };
   ws: WebSocket | null;
   systemMessage: string;
 }
@@ -42,14 +45,43 @@ export interface UpdateReadersPayload {
 const state: MessageState = {
   messages: {},
   unreadMessageIds: {},
+  lastSeq: {},
+  aheadSeq: {},
   ws: null,
   systemMessage: "",
 }
 
+// сколько ждать пропущенные номера, прежде чем просить их у сервера RESUME
+const RESUME_GAP_MS = 1000;
+const resumeTimers: { [id: string]: ReturnType<typeof setTimeout> } = {};
+
 const mutations = {
   SET_WS(state: MessageState, ws: WebSocket) {
     state.ws = ws;
   },
+  SET_LAST_SEQ(state: MessageState, payload: {chatId: string, seq: number}) {
+    if ((state.lastSeq[payload.chatId] ?? 0) < payload.seq) {
+      state.lastSeq[payload.chatId] = payload.seq;
+    }
+    const cursor = state.lastSeq[payload.chatId];
+    state.aheadSeq[payload.chatId] = (state.aheadSeq[payload.chatId] ?? []).filter(seq => seq > cursor);
+  },
+  // курсор RESUME двигается только по номерам подряд, пришедшие с разрывом ждут в aheadSeq
+  RECEIVE_SEQ(state: MessageState, payload: {chatId: string, seq: number}) {
+    const cursor = state.lastSeq[payload.chatId];
+    if (cursor === undefined) {
+      state.lastSeq[payload.chatId] = payload.seq;
+      return;
+    }
+    const ahead = new Set(state.aheadSeq[payload.chatId] ?? []);
+    ahead.add(payload.seq);
+    let next = cursor;
+    while (ahead.delete(next + 1)) {
+      next += 1;
+    }
+    state.lastSeq[payload.chatId] = next;
+    state.aheadSeq[payload.chatId] = [...ahead];
+  },
   SET_SYS_MSG(state: MessageState, message: string) {
     state.systemMessage = message;
   },
@@ -67,7 +99,14 @@ const mutations = {
       state.unreadMessageIds[payload.chatId].add(payload.message.id);
     }
     console.log(payload);
-    state.messages[payload.chatId].push(payload.message);
+    // докачка может прийти после более новых живых сообщений
+    const list = state.messages[payload.chatId];
+    const seq = payload.message.seq ?? Infinity;
+    let position = list.length;
+    while (position > 0 && (list[position - 1].seq ?? 0) > seq) {
+      position -= 1;
+    }
+    list.splice(position, 0, payload.message);
   },
   UPDATE_READERS(state: MessageState, payload: UpdateReadersPayload){
     const { chatId, messageId, readers } = payload;
@@ -114,11 +153,16 @@ const getters = {
   },
   systemMessage: (state: MessageState) => () => {
     return state.systemMessage;
+  },
+  isSeqSeen: (state: MessageState) => (chatId: string, seq: number) => {
+    const cursor = state.lastSeq[chatId];
+    if (cursor === undefined) return false;
+    return seq <= cursor || (state.aheadSeq[chatId] ?? []).includes(seq);
   }
 };
 
 const actions = {
-  connectWebSocket({commit, dispatch, state}: ActionContext<MessageState, RootState>) {
+  connectWebSocket({commit, dispatch, state, getters}: ActionContext<MessageState, RootState>) {
     if (state.ws !== null) return;
     console.log("CONNECT WS");
     const token = localStorage.getItem("authToken") || "{}";
@@ -129,6 +173,9 @@ const actions = {
     commit("SET_WS", ws);
     ws.onopen = () => {
       ws.send(JSON.stringify({type: EventType.PING}));
+      if (Object.keys(state.lastSeq).length > 0) {
+        dispatch("resume", {...state.lastSeq});
+      }
       if (reconnectInterval1 !== null) clearInterval(reconnectInterval1);
       if (reconnectInterval2 !== null) clearInterval(reconnectInterval2);
     };
@@ -138,8 +185,14 @@ const actions = {
         const data = JSON.parse(event.data);
         switch (data.type) {
           case EventType.MESSAGE:
+            if (getters.isSeqSeen(data.chat_id, data.seq)) break;
+            commit("RECEIVE_SEQ", {chatId: data.chat_id, seq: data.seq});
+            if ((state.aheadSeq[data.chat_id] ?? []).length > 0) {
+              dispatch("resumeGap", data.chat_id);
+            }
             const newMsg = {
               id: data.message_id,
+              seq: data.seq,
               username: data.user.username,
               user_id: data.user.user_id,
               content: data.message,
@@ -161,6 +214,10 @@ const actions = {
               )
             }
             break;
+          case EventType.RESUME:
+            // сервер обрезал докачку чата, продолжаем с next_seq
+            dispatch("resume", {[data.chat_id]: data.next_seq - 1});
+            break;
           case EventType.UPDATE_READERS:
             commit("UPDATE_READERS", {
               chatId: data.chat_id,
@@ -174,6 +231,9 @@ const actions = {
           case EventType.USER_EXIT_CHAT:
             commit("SET_SYS_MSG", `Пользователь ${data.user.username} вышел из чата`);
             break;
+          case EventType.PING:
+            ws.send(JSON.stringify({type: EventType.PONG}));
+            break;
           default:
             console.log("UB", event)
             break;
@@ -195,11 +255,13 @@ const actions = {
       reconnectInterval2 = setInterval(() => dispatch("connectWebSocket"), 100);
     };
   },
-  async loadHistory({state}: ActionContext<MessageState, RootState>, chatId: string) {
+  async loadHistory({state, commit}: ActionContext<MessageState, RootState>, chatId: string) {
     const {data} = await Api.getHistory(chatId);
-    data.forEach((val: any) => {
+    data.messages.forEach((val: any) => {
+      commit("SET_LAST_SEQ", {chatId: chatId, seq: val.seq});
       const newMsg = {
         id: val.message_id,
+        seq: val.seq,
         username: val.user.username,
         user_id: val.user.user_id,
         content: val.text,
@@ -211,6 +273,19 @@ const actions = {
       state.messages[chatId].push(newMsg);
     })
   },
+  resume({state}: ActionContext<MessageState, RootState>, cursors: { [id: string]: number }) {
+    if (!state.ws || state.ws.readyState !== WebSocket.OPEN) return;
+    state.ws.send(JSON.stringify({type: EventType.RESUME, cursors: cursors}));
+  },
+  resumeGap({state, dispatch}: ActionContext<MessageState, RootState>, chatId: string) {
+    if (resumeTimers[chatId] !== undefined) return;
+    resumeTimers[chatId] = setTimeout(() => {
+      delete resumeTimers[chatId];
+      if ((state.aheadSeq[chatId] ?? []).length > 0) {
+        dispatch("resume", {[chatId]: state.lastSeq[chatId]});
+      }
+    }, RESUME_GAP_MS);
+  },
   enterChat({state}: ActionContext<MessageState, RootState>, chatId: string) {
     state.ws.send(JSON.stringify({type: EventType.USER_ENTER_CHAT, chat_id: chatId}));
   },
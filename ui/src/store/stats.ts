@@ -8,6 +8,7 @@ export const EventType = {
     PING: "PING",
     PONG: "PONG",
     UPDATE_READERS: "UPDATE_READERS",
+    RESUME: "RESUME",
 } as const;
 
 export type BusEventType = typeof EventType[keyof typeof EventType];